@@ -0,0 +1,334 @@
+"""
+End-to-end benchmark of the face pipeline on synthetic workloads, stage by
+stage: cohort/index load from MongoDB, detection, encoding, matching, and
+matching accuracy at the login and attendance thresholds.
+
+    python -m benchmarks.face_pipeline_bench --sizes 1000,10000,100000,1000000
+    python -m benchmarks.face_pipeline_bench --stages detect,encode --face-dir ~/faces
+    python -m benchmarks.face_pipeline_bench --mongo-uri mongomock:// --sizes 1000
+
+Every stage runs in a fresh process so its peak RSS is its own. The load
+stage seeds --db on --mongo-uri (a local mongod, e.g. `docker run -p
+27017:27017 mongo`, or mongomock:// for an in-process stand-in, which
+needs `pip install mongomock`) and reuses the population on later runs.
+The match and accuracy stages need no database. Detection and encoding need
+face_recognition; pass --face-dir with real face photos for meaningful
+face counts (drawn placeholder faces are used otherwise).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+
+STAGES = ("load", "detect", "encode", "match", "accuracy")
+THRESHOLDS = (0.45, 0.6)
+
+
+def summarize(stage, size, samples, **extra):
+    """p50/p95 latency in ms and throughput (ops/s) for a list of durations in seconds."""
+    ms = np.asarray(samples) * 1000
+    return dict({
+        "stage": stage,
+        "size": size,
+        "n": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3) if len(ms) else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 3) if len(ms) else None,
+        "throughput": round(len(ms) / (ms.sum() / 1000), 2) if ms.sum() else None,
+    }, **extra)
+
+
+def timed(fn, repeat):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, samples
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _configure(args):
+    """Points the app modules at the benchmark database; must run before importing them."""
+    os.environ["MONGO_URI"] = args["mongo_uri"]
+    os.environ["DB_NAME"] = args["db"]
+    os.environ["FACE_SNAPSHOT_DIR"] = tempfile.mkdtemp(prefix="face_bench_")
+    if args["mongo_uri"].startswith("mongomock://"):
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ["MONGO_URI"] = "mongodb://localhost"
+
+
+def stage_load(args, size):
+    _configure(args)
+    from pymongo import MongoClient
+    from benchmarks.synthetic_faces import BENCH_COHORT, seed_users
+    from utils.face_cache import cohort_cache
+    from utils.face_index import FaceIndex
+    from utils.face_utils import load_known_faces_from_db
+
+    db = MongoClient(os.environ["MONGO_URI"])[args["db"]]
+    cohort_size = min(args["cohort_size"], size)
+    start = time.perf_counter()
+    seed_users(db, size, cohort_size)
+    seed_seconds = time.perf_counter() - start
+
+    def cold():
+        cohort_cache.clear()
+        return load_known_faces_from_db(*BENCH_COHORT)
+
+    (encs, _, _), cold_samples = timed(cold, args["repeat"])
+    _, warm_samples = timed(lambda: load_known_faces_from_db(*BENCH_COHORT), args["repeat"])
+
+    # First load scans the collection and writes the snapshot, the second maps it
+    _, scan_samples = timed(lambda: FaceIndex().load(), 1)
+    _, mapped_samples = timed(lambda: FaceIndex().load(), args["repeat"])
+
+    return [
+        summarize("load.cohort_cold", size, cold_samples, cohort=len(encs), seed_s=round(seed_seconds, 2)),
+        summarize("load.cohort_cached", size, warm_samples, cohort=len(encs)),
+        summarize("load.index_scan", size, scan_samples),
+        summarize("load.index_snapshot", size, mapped_samples),
+    ]
+
+
+def _classroom_images(args):
+    from benchmarks.synthetic_faces import classroom_image
+    return [
+        classroom_image(args["faces_per_image"], face_dir=args["face_dir"], seed=i)
+        for i in range(args["images"])
+    ]
+
+
+def _decode_and_locate(image, faces):
+    import cv2
+    import face_recognition
+    from utils.face_profiles import select_profile
+    from utils.image_ingest import decode_rgb, image_size
+
+    width, height = image_size(image)
+    profile = select_profile((height, width), faces)
+    img = decode_rgb(image, profile.detect_max_side, (width, height))
+    scale = profile.detect_scale(img.shape)
+    small = img if scale == 1.0 else cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    start = time.perf_counter()
+    locations = face_recognition.face_locations(small, profile.upsample, profile.model)
+    seconds = time.perf_counter() - start
+    locations = [tuple(int(v / scale) for v in loc) for loc in locations]
+    return img, profile, locations, seconds
+
+
+def stage_detect(args, size):
+    _configure(args)
+    samples, found = [], []
+    for image in _classroom_images(args):
+        _, profile, locations, seconds = _decode_and_locate(image, args["faces_per_image"])
+        samples.append(seconds)
+        found.append(len(locations))
+    return [summarize("detect", args["faces_per_image"], samples, profile=profile.name,
+                      faces_found=int(np.mean(found)))]
+
+
+def stage_encode(args, size):
+    _configure(args)
+    import face_recognition
+    from utils.face_compute import _detect_and_encode_image
+
+    encode_samples, per_face, end_to_end = [], [], []
+    for image in _classroom_images(args):
+        img, profile, locations, _ = _decode_and_locate(image, args["faces_per_image"])
+        if locations:
+            start = time.perf_counter()
+            face_recognition.face_encodings(img, locations, profile.num_jitters, profile.landmark_model)
+            seconds = time.perf_counter() - start
+            encode_samples.append(seconds)
+            per_face.append(seconds / len(locations))
+        _, samples = timed(lambda: _detect_and_encode_image(image, "attendance", args["faces_per_image"]), 1)
+        end_to_end.extend(samples)
+    return [
+        summarize("encode.photo", args["faces_per_image"], encode_samples),
+        summarize("encode.per_face", args["faces_per_image"], per_face),
+        summarize("detect+encode", args["faces_per_image"], end_to_end),
+    ]
+
+
+def stage_match(args, size):
+    _configure(args)
+    from bson import ObjectId
+    from benchmarks.face_ann_bench import synthetic_encodings, synthetic_queries
+    from benchmarks.synthetic_faces import BENCH_COHORT, capture_noise
+    from utils.face_index import FaceIndex
+    from utils.face_match import match_faces
+    from utils.face_snapshot import write_snapshot
+
+    population = synthetic_encodings(size)
+    write_snapshot(population, [ObjectId() for _ in range(size)], colids=[BENCH_COHORT[0]] * size)
+    # Served from the snapshot alone, so this stage needs no MongoDB
+    index = FaceIndex()
+    index.load(sync=False)
+
+    queries = synthetic_queries(population, args["queries"])
+    login_samples = []
+    for query in queries:
+        _, samples = timed(lambda: index.match(query), 1)
+        login_samples.extend(samples)
+
+    rng = np.random.default_rng(0)
+    cohort = population[:min(args["cohort_size"], size)]
+    present = rng.choice(len(cohort), min(args["faces_per_image"], len(cohort)), replace=False)
+    faces = cohort[present] + capture_noise(len(present), rng)
+    _, classroom_samples = timed(lambda: match_faces(faces, cohort), args["repeat"])
+
+    return [
+        summarize("match.login_1toN", size, login_samples, search=index._base_search.name),
+        summarize("match.classroom", size, classroom_samples, faces=len(faces), cohort=len(cohort)),
+    ]
+
+
+def stage_accuracy(args, size):
+    from benchmarks.face_ann_bench import synthetic_encodings
+    from benchmarks.synthetic_faces import capture_noise
+    from utils.face_ann import BruteForceSearch
+    from utils.face_match import match_faces
+
+    rng = np.random.default_rng(2)
+    count = args["queries"]
+    # Impostors and classroom strangers come from the same distribution as
+    # the enrolled population but are held out of it
+    people = synthetic_encodings(size + count)
+    population, impostors = people[:size], people[size:] + capture_noise(count, rng)
+    known = rng.integers(0, size, count)
+    genuine = population[known] + capture_noise(count, rng)
+
+    cohort = population[:min(args["cohort_size"], size)]
+    present = rng.choice(len(cohort), min(args["faces_per_image"], len(cohort)), replace=False)
+    strangers = impostors[:max(len(present) // 10, 1)]
+    classroom = np.vstack([cohort[present] + capture_noise(len(present), rng), strangers])
+
+    search = BruteForceSearch()
+    rows = []
+    for threshold in args["thresholds"]:
+        correct = wrong = missed = 0
+        for i, query in enumerate(genuine):
+            found, _ = search.search(population, query, threshold, k=1)
+            if not len(found):
+                missed += 1
+            elif found[0] == known[i]:
+                correct += 1
+            else:
+                wrong += 1
+        false_accepts = sum(len(search.search(population, q, threshold, k=1)[0]) > 0 for q in impostors)
+
+        assignment, _ = match_faces(classroom, cohort, tolerance=threshold)
+        marked = assignment[:len(present)]
+        rows.append({
+            "stage": "accuracy",
+            "size": size,
+            "threshold": threshold,
+            "login_true_accept": round(correct / count, 4),
+            "login_wrong_user": round(wrong / count, 4),
+            "login_false_reject": round(missed / count, 4),
+            "login_false_accept": round(false_accepts / count, 4),
+            "attendance_recall": round(float((marked == present).mean()), 4),
+            "attendance_strangers_marked": int((assignment[len(present):] >= 0).sum()),
+        })
+    return rows
+
+
+def _run_stage(name, args, size, queue):
+    try:
+        rows = globals()[f"stage_{name}"](args, size)
+        for row in rows:
+            row["peak_rss_mb"] = peak_rss_mb()
+        queue.put(rows)
+    except Exception as e:
+        queue.put([{"stage": name, "size": size, "error": f"{type(e).__name__}: {e}"}])
+
+
+def isolated(name, args, size):
+    """Runs one stage in a fresh interpreter so ru_maxrss is that stage's own peak."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_stage, args=(name, args, size, queue))
+    process.start()
+    rows = queue.get()
+    process.join()
+    return rows
+
+
+def print_rows(rows):
+    for row in rows:
+        if "error" in row:
+            print(f"{row['stage']:<22} size={row['size']:<8} ERROR {row['error']}")
+        elif row["stage"] == "accuracy":
+            print(f"{'accuracy':<22} size={row['size']:<8} t={row['threshold']:<5} "
+                  f"login TAR {row['login_true_accept']:.4f} wrong {row['login_wrong_user']:.4f} "
+                  f"FRR {row['login_false_reject']:.4f} FAR {row['login_false_accept']:.4f} | "
+                  f"attendance recall {row['attendance_recall']:.4f} "
+                  f"strangers marked {row['attendance_strangers_marked']}")
+        else:
+            print(f"{row['stage']:<22} size={row['size']:<8} n={row['n']:<5} "
+                  f"p50 {row['p50_ms']} ms  p95 {row['p95_ms']} ms  "
+                  f"{row['throughput']}/s  peak RSS {row['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="enrolled population sizes")
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="lms_face_bench")
+    parser.add_argument("--cohort-size", type=int, default=120, help="students in the benchmarked class")
+    parser.add_argument("--queries", type=int, default=200, help="login queries per size")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--images", type=int, default=5, help="synthetic classroom photos")
+    parser.add_argument("--faces-per-image", type=int, default=40)
+    parser.add_argument("--face-dir", help="directory of real face photos to build classrooms from")
+    parser.add_argument("--thresholds", default=",".join(str(t) for t in THRESHOLDS))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    stages = [s.strip() for s in args.stages.split(",")]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    config = {
+        "mongo_uri": args.mongo_uri,
+        "db": args.db,
+        "cohort_size": args.cohort_size,
+        "queries": args.queries,
+        "repeat": args.repeat,
+        "images": args.images,
+        "faces_per_image": args.faces_per_image,
+        "face_dir": args.face_dir,
+        "thresholds": [float(t) for t in args.thresholds.split(",")],
+    }
+
+    results = []
+    for stage in stages:
+        # Detection and encoding do not depend on the population size
+        for size in (sizes[:1] if stage in ("detect", "encode") else sizes):
+            rows = isolated(stage, config, size)
+            print_rows(rows)
+            results.extend(rows)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Synthetic workloads for the face benchmarks: enrolled-user populations
+seeded into MongoDB and classroom photos with a known head count.
+"""
+import os
+from io import BytesIO
+import numpy as np
+from benchmarks.face_ann_bench import synthetic_encodings
+from utils.face_codec import encode_facedata
+
+# The cohort every benchmark loads: colid / programcode / admissionyear
+BENCH_COHORT = (1000, "bench0", "2024")
+BENCH_COLLEGES = 50
+BENCH_PROGRAMS = 8
+
+
+def capture_noise(count, rng, dim=128, median_distance=0.38, spread=0.25):
+    """
+    Per-photo capture noise for re-taking an enrolled face. The distance to
+    the enrolled encoding is log-normally spread around `median_distance`,
+    so some genuine pairs land between 0.45 and 0.6 as real dlib pairs do.
+    """
+    distances = median_distance * rng.lognormal(0.0, spread, size=(count, 1))
+    return (rng.normal(0, 1, size=(count, dim)) * distances / np.sqrt(dim)).astype(np.float32)
+
+
+def synthetic_users(encodings, cohort_size):
+    """
+    User documents shaped like register() writes them. The first
+    `cohort_size` rows form BENCH_COHORT; the rest are spread over other
+    colleges, programs and years so cohort queries have to filter.
+    """
+    colid, program, year = BENCH_COHORT
+    for i, encoding in enumerate(encodings):
+        if i < cohort_size:
+            user_colid, user_program, user_year = colid, program, year
+        else:
+            user_colid = colid + 1 + i % BENCH_COLLEGES
+            user_program = f"bench{i % BENCH_PROGRAMS}"
+            user_year = str(2020 + i % 5)
+        yield {
+            "email": f"bench{i}@example.com",
+            "name": f"Student {i}",
+            "role": "Student",
+            "colid": user_colid,
+            "programcode": user_program,
+            "admissionyear": user_year,
+            "regno": f"B{i:07d}",
+            "facedata": encode_facedata(encoding),
+        }
+
+
+def seed_users(db, size, cohort_size, batch=10000, seed=0):
+    """
+    Fills db.users with `size` synthetic students unless it already holds
+    exactly that population. Returns the encodings that were (or would have
+    been) written, in insertion order.
+    """
+    encodings = synthetic_encodings(size, seed=seed)
+    meta = db.bench_meta.find_one({"_id": "users"})
+    if meta and meta.get("size") == size and meta.get("cohort_size") == cohort_size \
+            and db.users.estimated_document_count() == size:
+        return encodings
+
+    db.users.drop()
+    docs = []
+    for doc in synthetic_users(encodings, cohort_size):
+        docs.append(doc)
+        if len(docs) == batch:
+            db.users.insert_many(docs, ordered=False)
+            docs = []
+    if docs:
+        db.users.insert_many(docs, ordered=False)
+    db.users.create_index([("colid", 1), ("programcode", 1), ("admissionyear", 1)])
+    db.bench_meta.replace_one(
+        {"_id": "users"}, {"_id": "users", "size": size, "cohort_size": cohort_size}, upsert=True
+    )
+    return encodings
+
+
+def _face_crops(face_dir):
+    from PIL import Image
+    crops = []
+    for name in sorted(os.listdir(face_dir)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png")):
+            with Image.open(os.path.join(face_dir, name)) as img:
+                crops.append(img.convert("RGB"))
+    if not crops:
+        raise ValueError(f"No face images in {face_dir}")
+    return crops
+
+
+def _drawn_face(size, rng):
+    """A plain cartoon face; HOG rarely fires on it, so detect timings stay valid but counts do not."""
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (size, size), tuple(int(v) for v in rng.integers(60, 200, 3)))
+    draw = ImageDraw.Draw(img)
+    skin = tuple(int(v) for v in rng.integers(150, 230, 3))
+    draw.ellipse((size * 0.15, size * 0.05, size * 0.85, size * 0.95), fill=skin)
+    for x in (0.35, 0.65):
+        draw.ellipse((size * (x - 0.06), size * 0.35, size * (x + 0.06), size * 0.45), fill=(30, 30, 30))
+    draw.arc((size * 0.35, size * 0.55, size * 0.65, size * 0.75), 0, 180, fill=(120, 40, 40), width=max(size // 30, 1))
+    return img
+
+
+def classroom_image(faces, width=3000, height=2000, face_dir=None, seed=0, quality=90):
+    """
+    JPEG of a lecture hall seen from the front: `faces` heads in rows that
+    shrink towards the back. Heads are real face photos from `face_dir`
+    when given (needed for meaningful detection counts), drawn ones
+    otherwise.
+    """
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    crops = _face_crops(face_dir) if face_dir else None
+    canvas = Image.new("RGB", (width, height), (90, 80, 70))
+
+    rows = max(int(np.ceil(np.sqrt(faces / 2))), 1)
+    per_row = int(np.ceil(faces / rows))
+    placed = 0
+    for r in range(rows):
+        # Front row at the bottom with the largest heads
+        size = int(height / (rows + 2) * (1.0 - 0.5 * r / max(rows - 1, 1)))
+        y = height - (r + 1) * height // (rows + 1)
+        for c in range(per_row):
+            if placed == faces:
+                break
+            x = int((c + 0.5) * width / per_row - size / 2 + rng.integers(-size // 8, size // 8 + 1))
+            if crops:
+                head = crops[rng.integers(len(crops))].resize((size, size))
+            else:
+                head = _drawn_face(size, rng)
+            canvas.paste(head, (max(x, 0), max(y - size // 2, 0)))
+            placed += 1
+
+    buffer = BytesIO()
+    canvas.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
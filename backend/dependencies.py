@@ -1,5 +1,27 @@
-from flask import g, abort
+from functools import wraps
+from flask import g, abort, jsonify
+from flask_login import current_user
+
+# Roles allowed to run administrative endpoints (bulk enrolment, refits, stats)
+STAFF_ROLES = ("faculty", "admin")
 
 def get_current_user():
   
     return {"id": "Faculty123", "username": "Faculty"}
+
+def get_staff_user():
+    """The logged-in flask_login user if they are faculty or admin, else None."""
+    if not current_user.is_authenticated or getattr(current_user, "role", None) not in STAFF_ROLES:
+        return None
+    return current_user
+
+def faculty_required(view):
+    """Answers 401 without a login session and 403 for non-staff users."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify({"error": "Login required"}), 401
+        if get_staff_user() is None:
+            return jsonify({"error": "Faculty access required"}), 403
+        return view(*args, **kwargs)
+    return wrapper
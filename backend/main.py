@@ -8,6 +8,7 @@ from routes.quizassign.faculty_view import router as Faculty_router
 from routes.quizassign.student_view import router as Student_router
 from routes.auth.auth import router as auth_router
 from routes.auth.face_login import router as face_login_router
+from routes.auth.bulk_enrol import router as bulk_enrol_router
 from difflib import SequenceMatcher
 from flask_login import LoginManager
 from routes.auth.user import DummyUser
@@ -21,6 +22,9 @@ login_manager.init_app(app)
 
 app.secret_key = os.getenv("SECRET_KEY", "supersecretkey123")
 
+# Hard cap on request bodies; per-file limits are enforced in utils/image_ingest.py
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_BYTES", 256 * 1024 * 1024))
+
 # Register blueprints from all routes
 app.register_blueprint(evaluation.router)
 app.register_blueprint(quizzes.router)
@@ -41,6 +45,7 @@ app.register_blueprint(forms.router)
 app.register_blueprint(upload.router)
 app.register_blueprint(auth_router)
 app.register_blueprint(face_login_router)
+app.register_blueprint(bulk_enrol_router)
 
 @app.route("/", methods=["GET"])
 def root():
@@ -1,18 +1,114 @@
-import base64
 import traceback
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-from pymongo import MongoClient
-from utils.face_utils import load_known_faces_from_db, recognize_faces_from_bytes
-from dependencies import get_current_user
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from utils.face_utils import (
+    load_known_faces_from_db, recognize_faces_from_bytes, recognize_faces_from_batch, recognize_faces_from_video
+)
+from utils.face_cache import cohort_cache
+from utils.admission import face_admission
+from utils.face_compute import FaceComputeError
+from utils.photo_store import (
+    cohort_fingerprint, get_recognition, photo_key, save_recognition, store_photo
+)
+from utils.image_ingest import VIDEO_MAX_BYTES, IngestedUpload, InvalidImage, UploadTooLarge
+from utils.video_attendance import FACE_VIDEO_MAX_SECONDS, InvalidVideo, probe_video
+from dependencies import faculty_required, get_current_user
 import os
+import zipfile
+
+ATTENDANCE_BATCH_MAX_IMAGES = int(os.getenv("ATTENDANCE_BATCH_MAX_IMAGES", 10))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
 
 client = MongoClient(os.getenv("MONGO_URI"))
 db = client[os.getenv("DB_NAME")]
 
 upload_router = Blueprint("upload", __name__, url_prefix="/api")
 
+ROSTER_PROJECTION = {
+    "name": 1, "program": 1, "programcode": 1, "admissionyear": 1, "course": 1,
+    "coursecode": 1, "user": 1, "classid": 1, "student": 1, "regno": 1, "att": 1,
+    "semester": 1, "section": 1, "status1": 1, "comments": 1,
+}
+
+_attendance_index_ready = False
+ATTENDANCE_INDEX = "student_classdate_period_upload"
+
+def _ensure_attendance_index():
+    global _attendance_index_ready
+    if not _attendance_index_ready:
+        # Only records written with a student_id take part; older rows predate it
+        db.attendance.create_index(
+            [("student_id", 1), ("classdate", 1), ("period", 1), ("upload_key", 1)],
+            name=ATTENDANCE_INDEX,
+            unique=True,
+            partialFilterExpression={"student_id": {"$exists": True}}
+        )
+        _attendance_index_ready = True
+
+def mark_attendance(present_ids, colid, current_user, period="", upload_key=None, photo_keys=None):
+    """
+    Writes one attendance row per recognised student in two round trips: one
+    $in roster query and one bulk upsert. Rows are keyed by
+    (student_id, classdate, period, upload_key), where `upload_key` is the
+    content hash of the uploaded photo(s) or clip: a retried upload of the
+    same bytes does not duplicate rows, while the next class of the day (a
+    new photo) gets its own even when clients send no period.
+    """
+    if not present_ids:
+        return 0
+
+    _ensure_attendance_index()
+
+    students = db.users.find({"_id": {"$in": present_ids}}, ROSTER_PROJECTION)
+    classdate = datetime.utcnow().strftime("%Y-%m-%d")
+
+    operations = []
+    for student in students:
+        attendance_record = {
+            "colid": colid,  
+            "name": student["name"],
+            "timestamp": datetime.utcnow(),
+            "program": student.get("program", "UNKNOWN"),       
+            "programcode": student.get("programcode", "UNKNOWN"),
+            "admissionyear": student.get("admissionyear", "UNKNOWN"),
+            "course": student.get("course", "UNKNOWN"),
+            "coursecode": student.get("coursecode", "UNKNOWN"),
+            "faculty": current_user.get("name", "UNKNOWN"),     
+            "attendance": 1,
+            "user": student.get("user", "UNKNOWN"),
+            "classid": student.get("classid", "UNKNOWN"),
+            "student": student.get("student", "UNKNOWN"),
+            "regno": student.get("regno", "UNKNOWN"),
+            "att": student.get("att", "UNKNOWN"),
+            "semester": student.get("semester", "UNKNOWN"),
+            "section": student.get("section", "UNKNOWN"),
+            "status1":student.get("status1", "UNKNOWN"),
+            "comments": student.get("comments", "UNKNOWN"),
+            "photo_keys": photo_keys or [],
+        }
+        operations.append(UpdateOne(
+            {"student_id": student["_id"], "classdate": classdate, "period": period, "upload_key": upload_key},
+            {"$setOnInsert": attendance_record},
+            upsert=True
+        ))
+
+    if not operations:
+        return 0
+    try:
+        # Unordered so a row upserted concurrently by a client retry does not
+        # stop the rest of the batch
+        result = db.attendance.bulk_write(operations, ordered=False)
+        return result.upserted_count
+    except BulkWriteError as e:
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        return e.details.get("nUpserted", 0)
+
 @upload_router.route("/attendance_upload", methods=["POST"])
+# Admitted per college by the `colid` form field (see utils.admission.request_colid)
+@face_admission
 def upload():
     try:
         current_user = get_current_user()
@@ -21,80 +117,237 @@ def upload():
         if not current_user:
             return jsonify({"error": "Unauthorized"}), 401
 
-        if 'image' not in request.files:
+        if 'image' not in request.files and 'video' not in request.files:
             return jsonify({"error": "No image provided"}), 400
         
         colid = request.form.get("colid")
         program_code = request.form.get("program_code")
         year = request.form.get('year')
+        period = request.form.get('period', '')
 
         print("colid:", colid)
 
-        file = request.files['image']
-        image_bytes = file.read()
+        if 'video' in request.files:
+            return upload_video(request.files['video'], colid, program_code, year, period, current_user)
 
-       
-        known_encs, known_names = load_known_faces_from_db(colid,program_code,year)
+        image = IngestedUpload.from_upload(request.files['image'])
+        try:
+            known_encs, known_names, known_ids = load_known_faces_from_db(colid,program_code,year)
 
-        
-        present, unknown, total = recognize_faces_from_bytes(
-            image_bytes, known_encs, known_names
-        )
-        for name in present:
-          student = db.users.find_one({"name": name, "role": "Student"})
-          db.uploaded_photos.insert_one({
+            with image.open() as photo:
+                key = store_photo(photo, image.content_type, image.key)
+            fingerprint = cohort_fingerprint(known_encs, known_names, known_ids)
+
+            # The same bytes against the same cohort always give the same result
+            memoized = get_recognition(key, fingerprint)
+            if memoized is not None:
+                present, unknown, total, present_ids, faces = memoized
+            else:
+                present, unknown, total, present_ids, faces = recognize_faces_from_bytes(
+                    image.source, known_encs, known_names, known_ids
+                )
+                save_recognition(key, fingerprint, present, unknown, total, present_ids, faces)
+        finally:
+            image.close()
+
+        db.uploaded_photos.insert_one({
             "colid": colid,
             "programcode": program_code,
             "timestamp": datetime.utcnow(),
-            "image_base64": base64.b64encode(image_bytes).decode(),
+            "photo_key": key,
             "present_Students": present,
             "unknown_faces": unknown,
             "total_faces": total,
             "year":year
         })
 
-        
-        for name in present:
-            if name == "Unknown":
-                continue
-
-           
-            student = db.users.find_one({"name": name, "role": "Student"})
-            if student:
-                attendance_record = {
-                    "colid": colid,  
-                    "name": student["name"],
-                    "timestamp": datetime.utcnow(),
-                    "program": student.get("program", "UNKNOWN"),       
-                    "programcode": student.get("programcode", "UNKNOWN"),
-                    "admissionyear": student.get("admissionyear", "UNKNOWN"),
-                    "course": student.get("course", "UNKNOWN"),
-                    "coursecode": student.get("coursecode", "UNKNOWN"),
-                    "faculty": current_user.get("name", "UNKNOWN"),     
-                    "period": "",                                 
-                    "attendance": 1,
-                    "user": student.get("user", "UNKNOWN"),
-                    "classid": student.get("classid", "UNKNOWN"),
-                    "student": student.get("student", "UNKNOWN"),
-                    "regno": student.get("regno", "UNKNOWN"),
-                    "att": student.get("att", "UNKNOWN"),
-                    "classdate": datetime.utcnow().strftime("%Y-%m-%d"),
-                    "semester": student.get("semester", "UNKNOWN"),
-                    "section": student.get("section", "UNKNOWN"),
-                    "status1":student.get("status1", "UNKNOWN"),
-                    "comments": student.get("comments", "UNKNOWN"),
-                }
-
-                
-                db.attendance.insert_one(attendance_record)
+        marked = mark_attendance(present_ids, colid, current_user, period, upload_key=key, photo_keys=[key])
+
+        return jsonify({
+            "message": "Attendance captured successfully",
+            "photo_key": key,
+            "memoized": memoized is not None,
+            "marked": marked,
+            "present": present,
+            "unknown": unknown,
+            "total": total,
+            "faces": faces
+        }), 200
+
+    except UploadTooLarge as e:
+        return jsonify({"error": "Upload too large", "details": str(e)}), 413
+
+    except InvalidVideo as e:
+        return jsonify({"error": "Invalid video", "details": str(e)}), 400
+
+    except InvalidImage as e:
+        return jsonify({"error": "Invalid image", "details": str(e)}), 400
+
+    except FaceComputeError as e:
+        return jsonify({"error": "Face processing unavailable", "details": str(e)}), 503
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({
+            "error": "Upload failed",
+            "details": str(e)
+        }), 500
+
+
+def upload_video(file, colid, program_code, year, period, current_user):
+    """
+    Attendance from a short classroom clip. The clip is streamed to a temp
+    file (hashed on the way for the recognition memo) and read back frame by
+    frame by the face-compute worker, so it is never held in memory whole.
+    """
+    video = IngestedUpload.from_upload(file, VIDEO_MAX_BYTES, spool_bytes=0)
+    try:
+        if not video.size:
+            return jsonify({"error": "Empty video"}), 400
+        # Rejects files OpenCV cannot open before any worker time is spent
+        duration = probe_video(video.path)
+        known_encs, known_names, known_ids = load_known_faces_from_db(colid, program_code, year)
+
+        key = video.key
+        fingerprint = cohort_fingerprint(known_encs, known_names, known_ids)
+
+        memoized = get_recognition(key, fingerprint)
+        if memoized is not None:
+            present, unknown, total, present_ids, faces = memoized
+        else:
+            present, unknown, total, present_ids, faces = recognize_faces_from_video(
+                video.path, known_encs, known_names, known_ids
+            )
+            save_recognition(key, fingerprint, present, unknown, total, present_ids, faces)
+    finally:
+        video.close()
+
+    db.uploaded_photos.insert_one({
+        "colid": colid,
+        "programcode": program_code,
+        "timestamp": datetime.utcnow(),
+        "video_key": key,
+        "present_Students": present,
+        "unknown_faces": unknown,
+        "total_faces": total,
+        "year": year
+    })
+
+    marked = mark_attendance(present_ids, colid, current_user, period, upload_key=key)
+
+    return jsonify({
+        "message": "Attendance captured successfully",
+        "video_key": key,
+        "memoized": memoized is not None,
+        "duration_seconds": round(duration, 2) if duration is not None else None,
+        # Frames after FACE_VIDEO_MAX_SECONDS are not read
+        "processed_seconds": round(min(duration, FACE_VIDEO_MAX_SECONDS), 2) if duration is not None else None,
+        "truncated": duration is not None and duration > FACE_VIDEO_MAX_SECONDS,
+        "marked": marked,
+        "present": present,
+        "unknown": unknown,
+        "total": total,
+        "faces": faces
+    }), 200
+
+
+@upload_router.route("/attendance_upload_batch", methods=["POST"])
+# Admitted per college by the `colid` form field (see utils.admission.request_colid)
+@face_admission
+def upload_batch():
+    """
+    Takes several photos of one class session (repeated `images` fields
+    and/or a `zip` of photos) and writes a single attendance result.
+    """
+    try:
+        current_user = get_current_user()
+
+        if not current_user:
+            return jsonify({"error": "Unauthorized"}), 401
+
+        colid = request.form.get("colid")
+        program_code = request.form.get("program_code")
+        year = request.form.get('year')
+        period = request.form.get('period', '')
+
+        files = request.files.getlist('images')
+        if len(files) > ATTENDANCE_BATCH_MAX_IMAGES:
+            return jsonify({
+                "error": f"At most {ATTENDANCE_BATCH_MAX_IMAGES} images per batch"
+            }), 400
+
+        images = []
+        try:
+            for f in files:
+                images.append(IngestedUpload.from_upload(f))
+            if 'zip' in request.files:
+                try:
+                    within_limit = read_zip_images(request.files['zip'], images)
+                except zipfile.BadZipFile:
+                    return jsonify({"error": "Invalid zip file"}), 400
+                if not within_limit:
+                    return jsonify({
+                        "error": f"At most {ATTENDANCE_BATCH_MAX_IMAGES} images per batch"
+                    }), 400
+
+            if not images:
+                return jsonify({"error": "No images provided"}), 400
+
+            known_encs, known_names, known_ids = load_known_faces_from_db(colid, program_code, year)
+
+            keys = []
+            for image in images:
+                with image.open() as photo:
+                    keys.append(store_photo(photo, image.content_type, image.key))
+            fingerprint = cohort_fingerprint(known_encs, known_names, known_ids)
+            batch_key = photo_key("".join(sorted(keys)).encode())
+
+            memoized = get_recognition(batch_key, fingerprint)
+            if memoized is not None:
+                present, unknown, total, present_ids, faces = memoized
+            else:
+                present, unknown, total, present_ids, faces = recognize_faces_from_batch(
+                    [image.source for image in images], known_encs, known_names, known_ids
+                )
+                # Only memoize when every image was recognised; one that failed
+                # to decode or timed out would otherwise stay missing
+                if len(faces) == len(images):
+                    save_recognition(batch_key, fingerprint, present, unknown, total, present_ids, faces)
+        finally:
+            for image in images:
+                image.close()
+
+        db.uploaded_photos.insert_one({
+            "colid": colid,
+            "programcode": program_code,
+            "timestamp": datetime.utcnow(),
+            "photo_keys": keys,
+            "present_Students": present,
+            "unknown_faces": unknown,
+            "total_faces": total,
+            "year": year
+        })
+
+        marked = mark_attendance(present_ids, colid, current_user, period, upload_key=batch_key, photo_keys=keys)
 
         return jsonify({
             "message": "Attendance captured successfully",
+            "images": len(images),
+            "photo_keys": keys,
+            "memoized": memoized is not None,
+            "marked": marked,
             "present": present,
             "unknown": unknown,
-            "total": total
+            "total": total,
+            "faces": faces
         }), 200
 
+    except UploadTooLarge as e:
+        return jsonify({"error": "Upload too large", "details": str(e)}), 413
+
+    except FaceComputeError as e:
+        return jsonify({"error": "Face processing unavailable", "details": str(e)}), 503
+
     except Exception as e:
         traceback.print_exc()
         return jsonify({
@@ -102,6 +355,30 @@ def upload():
             "details": str(e)
         }), 500
 
+def read_zip_images(file, images):
+    """
+    Streams image entries out of a zip into `images`, each one size-checked
+    like a direct upload. Returns False without reading anything if the
+    batch would go over ATTENDANCE_BATCH_MAX_IMAGES.
+    """
+    with zipfile.ZipFile(file.stream) as archive:
+        entries = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if len(images) + len(entries) > ATTENDANCE_BATCH_MAX_IMAGES:
+            return False
+        for info in entries:
+            suffix = os.path.splitext(info.filename)[1]
+            with archive.open(info) as member:
+                images.append(IngestedUpload.from_stream(member, suffix=suffix))
+    return True
+
+
+@upload_router.route("/attendance_cache_stats", methods=["GET"])
+@faculty_required
+def attendance_cache_stats():
+    return jsonify(cohort_cache.stats()), 200
 
 
 router = upload_router
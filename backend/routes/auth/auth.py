@@ -15,6 +15,13 @@ from cv2 import cvtColor, COLOR_BGR2RGB
 import cv2
 from PIL import Image
 import io
+from utils.admission import face_admission
+from utils.face_index import face_index
+from utils.face_cache import cohort_cache
+from utils.face_compute import FaceComputeError, encode_faces
+from utils.face_codec import encode_facedata
+from utils.face_prefilter import PrefilterRejected
+from utils.image_ingest import IngestedUpload, InvalidImage, UploadTooLarge
 
 client = MongoClient(os.getenv("MONGO_URI"))
 db = client[os.getenv("DB_NAME")]
@@ -28,6 +35,8 @@ def is_valid_password(password):
     return len(password) >= 6  
 
 @router.route("/register", methods=["POST"])
+# Admitted per college by the `colid` form field (see utils.admission.request_colid)
+@face_admission
 def register():
     name = request.form.get('name')
     email = request.form.get('email')
@@ -61,25 +70,39 @@ def register():
 
     try:
      
-        file_bytes = np.frombuffer(image_file.read(), np.uint8)
-        image_bgr = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-        if image_bgr is None:
-            return jsonify({'error': 'Invalid image format'}), 400
-
-        img_array = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-        encodings = face_recognition.face_encodings(img_array)
+        with IngestedUpload.from_upload(image_file) as image:
+            encodings = encode_faces(image.source, purpose="register")
 
         if len(encodings) == 0:
             return jsonify({'error': 'No face detected in the image'}), 400
 
-        face_encoding = encodings[0].tolist()
+        face_encoding = encode_facedata(encodings[0])
+    except PrefilterRejected as e:
+        return jsonify({'error': e.message, 'reason': e.reason}), 400
+    except InvalidImage:
+        return jsonify({'error': 'Invalid image format'}), 400
+    except UploadTooLarge as e:
+        return jsonify({'error': 'Image too large', 'details': str(e)}), 413
+    except FaceComputeError as e:
+        return jsonify({'error': 'Face processing unavailable', 'details': str(e)}), 503
     except Exception as e:
         return jsonify({'error': 'Image processing failed', 'details': str(e)}), 500
 
     hashed_password = generate_password_hash(password)
 
-    db.users.insert_one({
+    result = db.users.insert_one(new_user_document(
+        email, name, hashed_password, role, colid, programcode, admissionyear, face_encoding
+    ))
+    face_index.add(result.inserted_id, face_encoding, colid)
+    if role == "Student":
+        cohort_cache.invalidate(colid, programcode, admissionyear)
+
+    return jsonify({'message': 'User registered successfully'}), 201
+
+
+def new_user_document(email, name, hashed_password, role, colid, programcode, admissionyear,
+                      face_encoding, regno='Unknown'):
+    return {
         'email': email,
         'name': name,
         'password': hashed_password,
@@ -88,7 +111,9 @@ def register():
         'programcode': programcode,
         'status': 1,
         'facedata': face_encoding,
-        'regno': 'Unknown',
+        # Face indexes in every worker sync on this; set it whenever facedata changes
+        'facedata_updated_at': datetime.utcnow(),
+        'regno': regno,
         'admissionyear': admissionyear,
         'semester': 'Unknown',
         'section': 'Unknown',
@@ -104,9 +129,8 @@ def register():
         'status1': 'Unknown',
         'comments': 'Unknown',
         'lastlogin': None
-    })
+    }
 
-    return jsonify({'message': 'User registered successfully'}), 201
 
 @router.route("/login", methods=["POST"])
 def login():
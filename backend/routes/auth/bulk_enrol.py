@@ -0,0 +1,322 @@
+import csv
+import io
+import json
+import os
+import traceback
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from werkzeug.security import generate_password_hash
+from flask_login import current_user
+from dependencies import faculty_required
+from routes.auth.auth import is_valid_email, is_valid_password, new_user_document
+from utils.admission import AdmissionRejected, busy_response, face_admission_controller
+from utils.face_cache import cohort_cache
+from utils.face_codec import encode_facedata
+from utils.face_compute import FaceComputeError, encode_faces_iter
+from utils.face_index import face_index
+from utils.face_match import pairwise_distances
+from utils.image_ingest import IngestedUpload, UploadTooLarge
+
+client = MongoClient(os.getenv("MONGO_URI"))
+db = client[os.getenv("DB_NAME")]
+
+router = Blueprint("bulk_enrol", __name__, url_prefix="/api")
+
+BULK_ENROL_MAX_ROWS = int(os.getenv("BULK_ENROL_MAX_ROWS", 5000))
+BULK_ENROL_MAX_ZIP_BYTES = int(os.getenv("BULK_ENROL_MAX_ZIP_BYTES", 256 * 1024 * 1024))
+BULK_ENROL_INSERT_BATCH = int(os.getenv("BULK_ENROL_INSERT_BATCH", 500))
+# Password hashing is deliberately slow; hashlib releases the GIL, so a few
+# threads hash while the face workers encode
+BULK_ENROL_HASH_THREADS = int(os.getenv("BULK_ENROL_HASH_THREADS", 4))
+# Two enrolment photos closer than this are treated as the same person.
+# Stricter than the login tolerance so a large intake does not flag
+# look-alikes by chance.
+BULK_ENROL_DUPLICATE_TOLERANCE = float(os.getenv("BULK_ENROL_DUPLICATE_TOLERANCE", 0.4))
+
+ROSTER_COLUMNS = ("name", "email", "password", "programcode", "photo")
+
+
+def parse_roster(file, colid):
+    """
+    Reads the CSV roster into row dicts. Columns: name, email, password,
+    programcode, photo (file name inside the zip), and optionally role
+    (only "Student"), admissionyear and regno. Rows failing the same checks as /register get
+    an "error" instead of being dropped, so the report covers every line.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(file.stream, encoding="utf-8-sig"))
+    missing = [c for c in ROSTER_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Roster is missing columns: {', '.join(missing)}")
+
+    rows = []
+    for line, record in enumerate(reader, start=2):
+        if len(rows) >= BULK_ENROL_MAX_ROWS:
+            raise ValueError(f"Roster has more than {BULK_ENROL_MAX_ROWS} rows")
+        record = {k.strip().lower(): (v or "").strip() for k, v in record.items() if k}
+        row = {
+            "line": line,
+            "name": record["name"],
+            "email": record["email"],
+            "password": record["password"],
+            "role": record.get("role") or "Student",
+            "colid": colid,
+            "programcode": record["programcode"],
+            "admissionyear": record.get("admissionyear") or None,
+            "regno": record.get("regno") or "Unknown",
+            "photo": record["photo"],
+        }
+        row["error"] = validate_row(row)
+        rows.append(row)
+    return rows
+
+
+def validate_row(row):
+    if not all([row["name"], row["email"], row["password"], row["programcode"], row["photo"]]):
+        return "Missing required field"
+    # Staff accounts are created one at a time through /register
+    if row["role"] != "Student":
+        return "Bulk enrolment only creates Student accounts"
+    if not is_valid_email(row["email"]):
+        return "Invalid email"
+    if not is_valid_password(row["password"]):
+        return "Password must be at least 6 characters"
+    year = row["admissionyear"]
+    if not year or not (year.isdigit() and len(year) == 4):
+        return "Admission year must be a valid 4-digit year"
+    return None
+
+
+def flag_duplicate_emails(rows):
+    """Marks repeats within the roster and emails already registered (one $in query)."""
+    counts = Counter(row["email"] for row in rows if not row["error"])
+    seen = set()
+    for row in rows:
+        if row["error"]:
+            continue
+        if counts[row["email"]] > 1 and row["email"] in seen:
+            row["error"] = "Duplicate email in roster"
+        seen.add(row["email"])
+
+    emails = [row["email"] for row in rows if not row["error"]]
+    existing = {
+        user["email"] for user in db.users.find({"email": {"$in": emails}}, {"email": 1})
+    } if emails else set()
+    for row in rows:
+        if not row["error"] and row["email"] in existing:
+            row["error"] = "User already exists"
+
+
+def photo_uploads(rows, archive, members, skipped):
+    """
+    Lazily reads each pending row's photo from the zip, size-checked like
+    /register, as (tag, source) items for encode_faces_iter(). Rows whose
+    photo is missing or unreadable get an error and are appended to
+    `skipped` instead.
+    """
+    for row in rows:
+        info = members.get(row["photo"].lower())
+        if info is None:
+            row["error"] = "Photo not found in zip"
+            skipped.append(row)
+            continue
+        try:
+            with archive.open(info) as member:
+                upload = IngestedUpload.from_stream(member, suffix=os.path.splitext(info.filename)[1])
+        except UploadTooLarge as e:
+            row["error"] = str(e)
+            skipped.append(row)
+            continue
+        except Exception as e:
+            # Corrupt or unsupported zip members fail this row, not the stream
+            row["error"] = f"Photo could not be read: {e}"
+            skipped.append(row)
+            continue
+        yield (row, upload), upload.source
+
+
+def flag_duplicate_faces(rows, colid):
+    """
+    Near-duplicate check for every encoded row in one vectorized pass:
+    against faces already enrolled in the college (blocked matrix products
+    over the face index) and against earlier rows of the same roster.
+    """
+    encoded = [row for row in rows if not row["error"]]
+    if not encoded:
+        return
+    matrix = np.stack([row["encoding"] for row in encoded])
+
+    enrolled_ids, enrolled_distances = face_index.nearest_many(matrix, colid=colid)
+
+    within = pairwise_distances(matrix, matrix)
+    # Only compare each row with the rows before it, so the first photo of a
+    # pair is kept and the later one is flagged
+    within[np.triu_indices(len(encoded))] = np.inf
+    earlier = within.argmin(axis=1)
+    earlier_distances = within[np.arange(len(encoded)), earlier]
+
+    for i, row in enumerate(encoded):
+        if enrolled_distances[i] < BULK_ENROL_DUPLICATE_TOLERANCE:
+            row["error"] = "Face already enrolled"
+            row["duplicate_of"] = str(enrolled_ids[i])
+        elif earlier_distances[i] < BULK_ENROL_DUPLICATE_TOLERANCE:
+            row["error"] = "Same face as another roster row"
+            row["duplicate_of"] = f"line {encoded[earlier[i]]['line']}"
+
+
+def insert_rows(rows, hashes):
+    """insert_many in batches; returns the number of users created."""
+    inserted = 0
+    pending = [row for row in rows if not row["error"]]
+    for start in range(0, len(pending), BULK_ENROL_INSERT_BATCH):
+        batch = pending[start:start + BULK_ENROL_INSERT_BATCH]
+        docs = [
+            new_user_document(
+                row["email"], row["name"], hashes[row["line"]].result(), row["role"], row["colid"],
+                row["programcode"], row["admissionyear"], row["facedata"], row["regno"]
+            )
+            for row in batch
+        ]
+        try:
+            result = db.users.insert_many(docs, ordered=False)
+            ids = result.inserted_ids
+        except BulkWriteError as e:
+            # A unique email index can still reject rows registered meanwhile
+            failed = {err["index"]: err.get("errmsg", "Insert failed") for err in e.details["writeErrors"]}
+            for index, message in failed.items():
+                batch[index]["error"] = message
+            ids = [doc.get("_id") if i not in failed else None for i, doc in enumerate(docs)]
+
+        for row, user_id in zip(batch, ids):
+            if user_id is None:
+                continue
+            row["user_id"] = str(user_id)
+            face_index.add(user_id, row["facedata"], row["colid"])
+            inserted += 1
+
+    for colid, programcode, year in {(r["colid"], r["programcode"], r["admissionyear"])
+                                     for r in pending if r.get("user_id") and r["role"] == "Student"}:
+        cohort_cache.invalidate(colid, programcode, year)
+    return inserted
+
+
+def event(kind, **fields):
+    return json.dumps(dict(fields, event=kind), default=str) + "\n"
+
+
+@router.route("/register/bulk", methods=["POST"])
+@faculty_required
+def register_bulk():
+    """
+    Enrols a whole intake of students into the caller's college from a CSV
+    roster plus a zip of photos. Progress is streamed back as
+    newline-delimited JSON: one "row" event per pending row as its photo is
+    read and encoded, then duplicate checks, the insert and a final summary.
+    """
+    roster = request.files.get("roster")
+    photos = request.files.get("photos")
+    colid_raw = (request.form.get("colid") or "").strip()
+
+    if not roster or not photos or not colid_raw:
+        return jsonify({"error": "roster (CSV), photos (zip) and colid are required"}), 400
+    if not colid_raw.isdigit():
+        return jsonify({"error": "College ID must be a numeric value"}), 400
+    colid = int(colid_raw)
+    if current_user.role != "admin" and str(current_user.colid).strip() != colid_raw:
+        return jsonify({"error": "You can only enrol students into your own college"}), 403
+
+    try:
+        rows = parse_roster(roster, colid)
+        # Flask closes request files once the view returns, so the archive is
+        # copied to a temp file the streamed response owns
+        bundle = IngestedUpload.from_stream(photos.stream, BULK_ENROL_MAX_ZIP_BYTES, suffix=".zip", spool_bytes=0)
+    except UploadTooLarge as e:
+        return jsonify({"error": "Photo archive too large", "details": str(e)}), 413
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"error": "Invalid roster", "details": str(e)}), 400
+
+    try:
+        archive = zipfile.ZipFile(bundle.path)
+    except zipfile.BadZipFile as e:
+        bundle.close()
+        return jsonify({"error": "Invalid photo archive", "details": str(e)}), 400
+
+    # The work happens while the response streams, so the admission slot is
+    # held until the stream is closed rather than around the view
+    try:
+        admission = face_admission_controller.acquire(colid)
+    except AdmissionRejected as e:
+        archive.close()
+        bundle.close()
+        return busy_response(e.retry_after, e.reason)
+
+    members = {
+        os.path.basename(info.filename).lower(): info
+        for info in archive.infolist() if not info.is_dir()
+    }
+
+    def generate():
+        hasher = ThreadPoolExecutor(max_workers=BULK_ENROL_HASH_THREADS)
+        try:
+            flag_duplicate_emails(rows)
+            pending = [row for row in rows if not row["error"]]
+            yield event("parsed", rows=len(rows), to_encode=len(pending), rejected=len(rows) - len(pending))
+
+            hashes = {row["line"]: hasher.submit(generate_password_hash, row["password"]) for row in pending}
+
+            reported = []
+
+            def row_event(row):
+                reported.append(row["line"])
+                return event("row", line=row["line"], email=row["email"], done=len(reported), total=len(pending),
+                             status="error" if row["error"] else "encoded", error=row["error"])
+
+            skipped = []
+            for (row, upload), encodings in encode_faces_iter(photo_uploads(pending, archive, members, skipped)):
+                upload.close()
+                while skipped:
+                    yield row_event(skipped.pop(0))
+                if isinstance(encodings, Exception):
+                    row["error"] = str(encodings) or "Image processing failed"
+                elif not encodings:
+                    row["error"] = "No face detected in the image"
+                else:
+                    row["encoding"] = np.asarray(encodings[0], dtype=np.float32)
+                    row["facedata"] = encode_facedata(encodings[0])
+                yield row_event(row)
+            while skipped:
+                yield row_event(skipped.pop(0))
+
+            flag_duplicate_faces(rows, colid)
+            yield event("duplicates", flagged=sum(1 for row in rows if row.get("duplicate_of")))
+
+            inserted = insert_rows(rows, hashes)
+            yield event("summary", rows=len(rows), inserted=inserted, failed=[
+                {"line": row["line"], "email": row["email"], "error": row["error"],
+                 "duplicate_of": row.get("duplicate_of")}
+                for row in rows if row["error"]
+            ])
+        except FaceComputeError as e:
+            yield event("error", error="Face processing unavailable", details=str(e))
+        except Exception as e:
+            traceback.print_exc()
+            yield event("error", error="Bulk enrolment failed", details=str(e))
+        finally:
+            hasher.shutdown(wait=False, cancel_futures=True)
+            archive.close()
+            bundle.close()
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    def close():
+        # Also covers a client that disconnects before the stream starts
+        archive.close()
+        bundle.close()
+        face_admission_controller.release(admission)
+
+    response.call_on_close(close)
+    return response
@@ -1,14 +1,14 @@
 import os
-import json
-import io
 from flask import Blueprint, request, jsonify
 from flask_login import login_user, UserMixin
-import face_recognition
-import numpy as np
-from PIL import Image
 from pymongo import MongoClient
 import logging
-from flask_jwt_extended import create_access_token
+from dependencies import faculty_required
+from utils.admission import face_admission, face_admission_controller
+from utils.face_index import face_index, verify_face
+from utils.face_compute import FaceComputeError, encode_faces, face_compute
+from utils.face_prefilter import PrefilterRejected, prefilter_stats
+from utils.image_ingest import IngestedUpload, InvalidImage, UploadTooLarge
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -20,66 +20,123 @@ db = client[os.getenv("DB_NAME")]
 
 router = Blueprint("face_login", __name__, url_prefix="/api")
 
+USER_PROJECTION = {"email": 1, "name": 1, "role": 1, "colid": 1}
+# regno defaults to "Unknown" at registration, so a hint may hit several users
+FACE_VERIFY_MAX_CANDIDATES = int(os.getenv("FACE_VERIFY_MAX_CANDIDATES", 10))
+# Registration placeholder; never treated as an identity hint
+PLACEHOLDER_REGNO = "unknown"
+
 class DummyUser(UserMixin):
     def __init__(self, user_id):
         self.id = str(user_id)
 
 @router.route("/face-login", methods=["POST"])
+# Admitted per college by the optional `colid` form field (see
+# utils.admission.request_colid); logins without one share the global limit
+@face_admission
 def face_login():
     image_file = request.files.get('image')
+    # Optional identity hint: email or regno turns the login into a 1:1
+    # verification, colid limits the search to one college
+    email = (request.form.get('email') or '').strip()
+    regno = (request.form.get('regno') or '').strip()
+    if regno.lower() == PLACEHOLDER_REGNO:
+        regno = ''
+    colid = (request.form.get('colid') or '').strip() or None
 
     if not image_file:
         return jsonify({'error': 'No image provided'}), 400
 
     try:
-        img = Image.open(image_file.stream).convert("RGB")  
-        img_array = np.array(img)
-
-        unknown_encodings = face_recognition.face_encodings(img_array)
+        with IngestedUpload.from_upload(image_file) as image:
+            unknown_encodings = encode_faces(image.source)
 
         if not unknown_encodings:
             return jsonify({'error': 'No face found in image'}), 400
 
         unknown_encoding = unknown_encodings[0]
 
-        users = list(db.users.find())  
-
-        for user in users:
-            encoding_data = user.get('facedata')
-            if not encoding_data:
-                continue
-
-            try:
-                
-                if isinstance(encoding_data, str):
-                    known_encoding = np.array(json.loads(encoding_data))
-                else:
-                    known_encoding = np.array(encoding_data)
-            except Exception as e:
-                continue
-
-            if known_encoding is None or known_encoding.size == 0:
-                continue
-
-            matches = face_recognition.compare_faces([known_encoding], unknown_encoding)
-
-            if matches[0]:
-                user_obj = DummyUser(user['_id'])
-                login_user(user_obj)
-                return jsonify({
-                    'message': 'Login successful',
-                    'email': user['email'],
-                    'name': user['name'],
-                    "role": user["role"],
-                    'token': str(user['_id']),
-                    'id': str(user['_id']),
-                    'colid': user.get('colid', 'N/A')
-                }), 200
+        if email or regno:
+            user, distance = verify_hint(unknown_encoding, email, regno, colid)
+        else:
+            user, distance = search_index(unknown_encoding, colid)
+
+        if user:
+            logger.debug(f"Face matched user {user['_id']} at distance {distance:.3f}")
+            user_obj = DummyUser(user['_id'])
+            login_user(user_obj)
+            return jsonify({
+                'message': 'Login successful',
+                'email': user['email'],
+                'name': user['name'],
+                "role": user["role"],
+                'token': str(user['_id']),
+                'id': str(user['_id']),
+                'colid': user.get('colid', 'N/A')
+            }), 200
 
         return jsonify({'error': 'Face not recognized'}), 401
 
+    except PrefilterRejected as e:
+        return jsonify({'error': e.message, 'reason': e.reason}), 400
+
+    except InvalidImage:
+        return jsonify({'error': 'Invalid image format'}), 400
+
+    except UploadTooLarge as e:
+        return jsonify({'error': 'Image too large', 'details': str(e)}), 413
+
+    except FaceComputeError as e:
+        return jsonify({
+            'error': 'Face processing unavailable',
+            'details': str(e)
+        }), 503
+
     except Exception as e:
         return jsonify({
             'error': 'Image processing failed',
             'details': str(e)
         }), 500
+
+
+def verify_hint(encoding, email, regno, colid):
+    """1:1 check against the user(s) named by an email or regno hint."""
+    query = {"email": email} if email else {"regno": regno}
+    if colid is not None:
+        query["colid"] = int(colid) if colid.isdigit() else colid
+    users = db.users.find(
+        query, dict(USER_PROJECTION, facedata=1)
+    ).limit(FACE_VERIFY_MAX_CANDIDATES)
+    return verify_face(encoding, users)
+
+
+def search_index(encoding, colid=None):
+    """1:N search over the face index, or over one college's partition of it."""
+    user_id, distance = face_index.match(encoding, colid=colid)
+    if user_id is None:
+        # Pick up registrations made by other workers before giving up
+        face_index.sync()
+        user_id, distance = face_index.match(encoding, colid=colid)
+    if user_id is None:
+        return None, None
+
+    query = {"_id": user_id}
+    if colid is not None:
+        # Also guards snapshots written before colid partitioning
+        query["colid"] = int(colid) if colid.isdigit() else colid
+    return db.users.find_one(query, USER_PROJECTION), distance
+
+
+@router.route("/face-login/prefilter-stats", methods=["GET"])
+@faculty_required
+def face_prefilter_stats():
+    return jsonify(prefilter_stats.stats()), 200
+
+
+@router.route("/face-admission/stats", methods=["GET"])
+@faculty_required
+def face_admission_stats():
+    return jsonify({
+        "admission": face_admission_controller.stats(),
+        "compute": face_compute.stats(),
+    }), 200
@@ -15,10 +15,12 @@ class DummyUser:
             self.name = user_data.get("name", "")
             self.email = user_data.get("email", "")
             self.role = user_data.get("role", "Student")
+            self.colid = user_data.get("colid")
         else:
             self.name = ""
             self.email = ""
             self.role = "Student"
+            self.colid = None
 
     def get_id(self):
         return self.id
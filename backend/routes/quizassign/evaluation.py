@@ -1,39 +1,110 @@
 from flask import Blueprint, request, jsonify
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import math
+import os
+from flask_login import current_user
+from dependencies import faculty_required
+from utils.answer_model import answer_models, model_key
+from utils.grading_prescreen import answer_similarity
 
 router = Blueprint('evaluation', __name__)
 
+# Largest batch /evaluate-descriptive/batch scores in one request
+EVALUATE_BATCH_MAX_ITEMS = int(os.getenv("EVALUATE_BATCH_MAX_ITEMS", 20000))
+
 class AnswerInput:
     def __init__(self, Student_answer: str, correct_answer: str):
         self.Student_answer = Student_answer
         self.correct_answer = correct_answer
 
+def feedback_for(score):
+    if score >= 80:
+        return "Excellent! You covered almost everything clearly."
+    elif score >= 60:
+        return "Good. You addressed key points, but could improve clarity or detail."
+    elif score >= 40:
+        return "Partial answer. Some concepts are missing or unclear."
+    return "Needs improvement. Please review the topic again."
+
 @router.route("/evaluate-descriptive", methods=["POST"])
 def evaluate_descriptive():
+    """
+    Scores one answer. With `colid` (and `question_id`) the college's fitted
+    answer model is used; without one, or when the question's reference has
+    changed since the model was fitted, a vectorizer is fitted on the pair.
+    """
     data = request.get_json()
     answer_input = AnswerInput(
         Student_answer=data['Student_answer'],
-        correct_answer=data['correct_answer']
+        correct_answer=data.get('correct_answer', "")
     )
-    
-    vectorizer = TfidfVectorizer().fit([answer_input.correct_answer, answer_input.Student_answer])
-    vecs = vectorizer.transform([answer_input.correct_answer, answer_input.Student_answer])
-    similarity = cosine_similarity(vecs[0:1], vecs[1:2])[0][0]
 
-    score = round(similarity * 100)
-
-    # ✨ Add feedback logic (identical to original)
-    if score >= 80:
-        feedback = "Excellent! You covered almost everything clearly."
-    elif score >= 60:
-        feedback = "Good. You addressed key points, but could improve clarity or detail."
-    elif score >= 40:
-        feedback = "Partial answer. Some concepts are missing or unclear."
+    model = answer_models.get(data["colid"]) if data.get("colid") is not None else None
+    fitted = model.reference(data["question_id"]) if model and data.get("question_id") else None
+    if fitted is not None and ("correct_answer" not in data
+                               or fitted == (answer_input.correct_answer or "").strip().lower()):
+        similarity = float(model.score([data["question_id"]], [answer_input.Student_answer])[0])
+    elif model and fitted is None:
+        similarity = model.score_text(answer_input.correct_answer, answer_input.Student_answer)
     else:
-        feedback = "Needs improvement. Please review the topic again."
+        similarity = answer_similarity(answer_input.correct_answer, answer_input.Student_answer)
+
+    score = round(similarity * 100)
 
     return jsonify({
         "score": score,
-        "feedback": feedback
-    })
\ No newline at end of file
+        "feedback": feedback_for(score)
+    })
+
+@router.route("/evaluate-descriptive/batch", methods=["POST"])
+def evaluate_descriptive_batch():
+    """
+    Scores many {question_id, answer} items of one college (`colid`) against
+    its fitted answer model in one pass. Items whose question is not in the
+    model get a null score; refit the model to include new questions.
+    """
+    data = request.get_json() or {}
+    items = data.get("items") or []
+    if data.get("colid") is None:
+        return jsonify({"error": "colid is required"}), 400
+    if len(items) > EVALUATE_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {EVALUATE_BATCH_MAX_ITEMS} items per batch"}), 400
+
+    model = answer_models.get(data["colid"])
+    if model is None:
+        return jsonify({"error": "No answer model for this college; fit one first"}), 404
+
+    similarity = model.score([item.get("question_id") for item in items], [item.get("answer") for item in items])
+    results, unknown = [], 0
+    for item, value in zip(items, similarity):
+        if math.isnan(value):
+            unknown += 1
+            results.append({"question_id": item.get("question_id"), "score": None, "feedback": None})
+            continue
+        score = round(value * 100)
+        results.append({"question_id": item.get("question_id"), "score": score, "feedback": feedback_for(score)})
+
+    return jsonify({
+        "model_version": model.version,
+        "scored": len(items) - unknown,
+        "unknown_questions": unknown,
+        "results": results
+    })
+
+@router.route("/answer-models", methods=["GET"])
+@faculty_required
+def list_answer_models():
+    return jsonify({"models": answer_models.loaded()})
+
+@router.route("/answer-models/<colid>/fit", methods=["POST"])
+@faculty_required
+def fit_answer_model(colid):
+    """Refits a college's answer model from its question bank; every worker switches to it."""
+    if current_user.role != "admin" and model_key(current_user.colid) != model_key(colid):
+        return jsonify({"error": "You can only fit your own college's answer model"}), 403
+    try:
+        model = answer_models.refit(colid)
+    except Exception as e:
+        return jsonify({"error": "Fitting answer model failed", "message": str(e)}), 500
+    if model is None:
+        return jsonify({"error": "No descriptive questions with reference answers for this college"}), 404
+    return jsonify({"message": "Answer model fitted", **model.info()})
@@ -0,0 +1,45 @@
+"""
+Rebuilds the on-disk face-index snapshot from MongoDB, folding every
+registration in the current delta log into a new version.
+
+    python -m scripts.build_face_snapshot
+
+Workers pick the new version up the next time they load the index; until
+then they keep serving from the snapshot they have mapped.
+"""
+import argparse
+import os
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+load_dotenv()
+
+from utils.face_codec import ENCODING_DIM, decode_facedata
+from utils.face_snapshot import FACE_SNAPSHOT_DIR, partition_key, write_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=FACE_SNAPSHOT_DIR, help="snapshot directory (FACE_SNAPSHOT_DIR)")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI"))
+    db = client[os.getenv("DB_NAME")]
+
+    ids, encodings, colids = [], [], []
+    for user in db.users.find({"facedata": {"$exists": True}}, {"facedata": 1, "colid": 1}).sort("_id", 1):
+        encoding = decode_facedata(user.get("facedata"))
+        if encoding is not None:
+            ids.append(user["_id"])
+            encodings.append(encoding)
+            colids.append(user.get("colid"))
+
+    matrix = np.stack(encodings) if encodings else np.empty((0, ENCODING_DIM), dtype=np.float32)
+    version = write_snapshot(matrix, ids, args.dir, colids=colids)
+    print(f"Wrote face snapshot v{version} with {len(ids)} encodings "
+          f"in {len(set(map(partition_key, colids)))} college partitions to {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
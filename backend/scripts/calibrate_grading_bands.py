@@ -0,0 +1,132 @@
+"""
+Calibrates the similarity pre-screen bands from past grading verdicts.
+
+    python -m scripts.calibrate_grading_bands            # report only
+    python -m scripts.calibrate_grading_bands --write    # store the bands
+
+Every graded descriptive answer in quiz and assignment submissions that the
+LLM graded (answers settled by the pre-screen itself are skipped) is
+scored with the same TF-IDF similarity the pre-screen uses. accept_above is
+the lowest similarity above which at least --precision of the answers
+were marked correct; reject_below the highest one below which at least
+--precision were marked incorrect. Workers pick stored bands up within
+GRADING_BANDS_REFRESH_SECONDS.
+"""
+import argparse
+import os
+from datetime import datetime
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+load_dotenv()
+
+from utils.grading_prescreen import BANDS_ID, answer_similarity
+
+# (question collections, submission collection, id field)
+SOURCES = (
+    (("quizzes", "scheduled_quizzes"), "submissions", "quiz_id"),
+    (("assignments", "scheduled_assignments"), "assignment_submissions", "assignment_id"),
+)
+
+
+def past_verdicts(db, limit=None):
+    """Yields (similarity, verdict) for LLM-graded descriptive answers."""
+    seen = 0
+    for question_collections, submission_collection, id_field in SOURCES:
+        for name in question_collections:
+            for item in db[name].find({}, {"questions": 1}):
+                references = {
+                    q["question"]: q.get("answer", "").strip().lower()
+                    for q in item.get("questions", []) if not q.get("options")
+                }
+                if not references:
+                    continue
+                for sub in db[submission_collection].find({id_field: str(item["_id"])}, {"answers": 1}):
+                    for question_text, reference in references.items():
+                        answer = (sub.get("answers") or {}).get(question_text)
+                        if not isinstance(answer, dict) or not isinstance(answer.get("is_correct"), bool):
+                            continue
+                        if answer.get("graded_by") == "similarity" or not (answer.get("text") or "").strip():
+                            continue
+                        yield answer_similarity(reference, answer["text"].strip()), answer["is_correct"]
+                        seen += 1
+                        if limit and seen >= limit:
+                            return
+
+
+def accept_band(similarity, correct, precision, min_support):
+    """Lowest threshold t with precision(correct | similarity >= t) >= precision over >= min_support answers."""
+    order = np.argsort(-similarity, kind="stable")
+    sims, hits = similarity[order], np.cumsum(correct[order])
+    support = np.arange(1, len(sims) + 1)
+    # Only cut between distinct similarities
+    last_of_value = np.append(sims[1:] != sims[:-1], True)
+    ok = last_of_value & (support >= min_support) & (hits / support >= precision)
+    return float(sims[np.flatnonzero(ok)[-1]]) if ok.any() else None
+
+
+def reject_band(similarity, correct, precision, min_support):
+    """Highest threshold t with precision(incorrect | similarity < t) >= precision over >= min_support answers."""
+    order = np.argsort(similarity, kind="stable")
+    sims, misses = similarity[order], np.cumsum(~correct[order])
+    support = np.arange(1, len(sims) + 1)
+    # Threshold just above each distinct value, so everything up to it is below
+    last_of_value = np.append(sims[1:] != sims[:-1], True)
+    ok = last_of_value & (support >= min_support) & (misses / support >= precision)
+    return float(np.nextafter(sims[np.flatnonzero(ok)[-1]], np.inf)) if ok.any() else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--precision", type=float, default=0.97,
+                        help="required agreement with past verdicts inside each band")
+    parser.add_argument("--min-support", type=int, default=50, help="fewest past answers a band may rest on")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many past answers")
+    parser.add_argument("--write", action="store_true", help="store the bands in grading_config")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI"))
+    db = client[os.getenv("DB_NAME")]
+
+    samples = list(past_verdicts(db, args.limit))
+    if not samples:
+        print("No LLM-graded descriptive answers to calibrate from")
+        return
+    similarity = np.array([s for s, _ in samples], dtype=np.float64)
+    correct = np.array([v for _, v in samples], dtype=bool)
+
+    accept_above = accept_band(similarity, correct, args.precision, args.min_support)
+    reject_below = reject_band(similarity, correct, args.precision, args.min_support)
+    # A band that cannot be supported is switched off
+    accept_above = accept_above if accept_above is not None else 1.01
+    reject_below = reject_below if reject_below is not None else 0.0
+    reject_below = min(reject_below, accept_above)
+
+    accepted, rejected = similarity >= accept_above, similarity < reject_below
+    settled = int(accepted.sum() + rejected.sum())
+    agree = int(correct[accepted].sum() + (~correct[rejected]).sum())
+    print(f"{len(samples)} past answers, {int(correct.sum())} marked correct")
+    print(f"accept_above={accept_above:.4f}: {int(accepted.sum())} answers, "
+          f"{correct[accepted].mean() if accepted.any() else 0:.2%} were correct")
+    print(f"reject_below={reject_below:.4f}: {int(rejected.sum())} answers, "
+          f"{(~correct[rejected]).mean() if rejected.any() else 0:.2%} were incorrect")
+    print(f"Pre-screen would settle {settled / len(samples):.1%} of answers "
+          f"(agreeing with {agree / settled if settled else 0:.2%} of past verdicts); "
+          f"LLM call rate {1 - settled / len(samples):.1%}")
+
+    if args.write:
+        db["grading_config"].replace_one({"_id": BANDS_ID}, {
+            "_id": BANDS_ID,
+            "accept_above": accept_above,
+            "reject_below": reject_below,
+            "precision": args.precision,
+            "samples": len(samples),
+            "coverage": round(settled / len(samples), 4),
+            "calibrated_at": datetime.utcnow()
+        }, upsert=True)
+        print("Stored bands in grading_config")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Fits the per-college answer models used by /evaluate-descriptive from the
+reference answers of each college's quizzes and assignments.
+
+    python -m scripts.fit_answer_models              # every college
+    python -m scripts.fit_answer_models --colid 1001
+
+Running workers switch to the new models within ANSWER_MODEL_CHECK_SECONDS.
+"""
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.answer_model import ANSWER_MODEL_DIR, QUESTION_COLLECTIONS, AnswerModelStore, db, model_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--colid", action="append", help="college to fit (repeatable); default all")
+    parser.add_argument("--dir", default=ANSWER_MODEL_DIR, help="model directory (ANSWER_MODEL_DIR)")
+    args = parser.parse_args()
+
+    colids = args.colid
+    if not colids:
+        colids = sorted({model_key(c) for name in QUESTION_COLLECTIONS for c in db[name].distinct("colid")} - {""})
+
+    store = AnswerModelStore(args.dir)
+    for colid in colids:
+        model = store.refit(colid)
+        if model is None:
+            print(f"colid {colid}: no descriptive reference answers, skipped")
+            continue
+        info = model.info()
+        print(f"colid {colid}: v{info['version']}, {info['questions']} questions, {info['vocabulary']} terms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Drains the descriptive-grading queue outside the web processes.
+
+    python -m scripts.grading_worker --workers 4
+
+Run web processes with GRADING_WORKERS=0 to leave all grading to these
+workers; jobs are leased, so any number of them can run side by side.
+"""
+import argparse
+import logging
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from routes.quizassign.submission import process_grading_job
+from utils.grading_queue import GRADING_WORKERS, grading_queue
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=max(GRADING_WORKERS, 1),
+                        help="grading threads (GRADING_WORKERS)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    threads = [
+        threading.Thread(target=grading_queue.work, args=(process_grading_job,), name=f"grading-worker-{i}", daemon=True)
+        for i in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Grading with {args.workers} worker(s) as {grading_queue.worker_id}; Ctrl+C to stop")
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        grading_queue.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Converts users' `facedata` from the legacy list-of-floats / JSON-string
+formats to the packed float32 binary format in utils/face_codec.py.
+
+    python -m scripts.migrate_facedata --dry-run
+    python -m scripts.migrate_facedata --batch-size 1000
+
+Safe to re-run: users already in the packed format are skipped, and all
+readers accept both formats while the migration is in progress.
+"""
+import argparse
+import os
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from utils.face_codec import decode_facedata, encode_facedata
+
+load_dotenv()
+
+
+def migrate(db, batch_size=500, dry_run=False):
+    query = {"facedata": {"$type": ["array", "string"]}}
+    converted = skipped = 0
+    batch = []
+
+    for user in db.users.find(query, {"facedata": 1}):
+        encoding = decode_facedata(user["facedata"])
+        if encoding is None:
+            skipped += 1
+            continue
+
+        batch.append(UpdateOne(
+            # Only replace the exact value read, so a concurrent re-enrolment wins
+            {"_id": user["_id"], "facedata": user["facedata"]},
+            {"$set": {"facedata": encode_facedata(encoding)}}
+        ))
+        if len(batch) >= batch_size:
+            converted += _flush(db, batch, dry_run)
+            batch = []
+
+    if batch:
+        converted += _flush(db, batch, dry_run)
+    return converted, skipped
+
+
+def _flush(db, batch, dry_run):
+    if dry_run:
+        return len(batch)
+    return db.users.bulk_write(batch, ordered=False).modified_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="count users to convert without writing")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI"))
+    db = client[os.getenv("DB_NAME")]
+
+    converted, skipped = migrate(db, args.batch_size, args.dry_run)
+    action = "Would convert" if args.dry_run else "Converted"
+    print(f"{action} {converted} users; skipped {skipped} with malformed facedata")
+
+
+if __name__ == "__main__":
+    main()
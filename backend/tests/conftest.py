@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Modules import as `utils.x` / `scripts.x` from backend/, like the app runs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Several utils open a (lazy) MongoClient at import; these tests never query it
+os.environ.setdefault("DB_NAME", "lms_test")
@@ -0,0 +1,37 @@
+import pytest
+from utils.answer_clusters import cluster_answers, jaccard, shingles
+
+
+def test_identical_after_normalisation_share_a_cluster():
+    clusters = cluster_answers(["The mitochondria", "the  MITOCHONDRIA", "Ribosomes make proteins"])
+    assert sorted(map(sorted, clusters)) == [[0, 1], [2]]
+
+
+def test_near_duplicates_cluster_and_different_answers_do_not():
+    base = "photosynthesis converts light energy into chemical energy stored in glucose"
+    texts = [base, base + " molecules", "cellular respiration releases energy from food", base]
+    clusters = cluster_answers(texts, threshold=0.8)
+    together = next(c for c in clusters if 0 in c)
+    assert set(together) == {0, 1, 3}
+    assert [2] in clusters
+
+
+def test_every_answer_is_in_exactly_one_cluster():
+    texts = [f"answer number {i % 7} about topic {i % 3}" for i in range(40)]
+    clusters = cluster_answers(texts)
+    assert sorted(i for cluster in clusters for i in cluster) == list(range(40))
+
+
+def test_empty_input():
+    assert cluster_answers([]) == []
+
+
+@pytest.mark.parametrize("a, b", [
+    ("the reaction is exothermic because heat is released to the surroundings",
+     "the reaction is not exothermic because heat is released to the surroundings"),
+    ("the boiling point of water at sea level is 100 degrees celsius",
+     "the boiling point of water at sea level is 101 degrees celsius"),
+])
+def test_answers_differing_in_negation_or_numbers_never_share_a_cluster(a, b):
+    assert jaccard(shingles(a), shingles(b)) >= 0.8
+    assert sorted(map(sorted, cluster_answers([a, b], threshold=0.5))) == [[0], [1]]
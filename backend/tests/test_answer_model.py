@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pytest
+from utils.answer_model import AnswerModel, AnswerModelStore, read_model, write_model
+from utils.app_dirs import UnsafeDirectory
+
+BANK = [
+    ("q1", "photosynthesis converts light energy into chemical energy"),
+    ("q2", "mitochondria release energy through cellular respiration"),
+    ("q3", "ribosomes assemble proteins from amino acids"),
+]
+ANSWERS = ["light energy becomes chemical energy", "respiration in mitochondria", "no idea"]
+
+
+def test_written_model_scores_like_the_fitted_one(tmp_path):
+    model = AnswerModel.fit("1001", BANK)
+    write_model(str(tmp_path), model)
+    loaded = read_model(str(tmp_path), "1001")
+
+    assert loaded.version == model.version and loaded.question_ids == model.question_ids
+    assert loaded.reference("q2") == BANK[1][1] and loaded.reference("missing") is None
+    np.testing.assert_allclose(loaded.score(["q1", "q2", "q3"], ANSWERS), model.score(["q1", "q2", "q3"], ANSWERS))
+    assert loaded.score_text("energy from light", "light energy") == pytest.approx(model.score_text("energy from light", "light energy"))
+    assert not any(name.endswith(".pkl") for name in os.listdir(tmp_path))
+
+
+def test_refit_replaces_the_previous_matrix(tmp_path):
+    first = AnswerModel.fit("1001", BANK)
+    write_model(str(tmp_path), first)
+    second = AnswerModel.fit("1001", BANK[:2])
+    second.version = first.version + 1
+    write_model(str(tmp_path), second)
+
+    assert sorted(os.listdir(tmp_path)) == ["1001-v%d.npz" % second.version, "1001.json"]
+    assert read_model(str(tmp_path), "1001").question_ids == ["q1", "q2"]
+
+
+def test_models_in_a_shared_writable_directory_are_not_loaded(tmp_path):
+    write_model(str(tmp_path), AnswerModel.fit("1001", BANK))
+    os.chmod(tmp_path, 0o777)
+    assert AnswerModelStore(str(tmp_path)).get("1001") is None
+    with pytest.raises(UnsafeDirectory):
+        write_model(str(tmp_path), AnswerModel.fit("1001", BANK))
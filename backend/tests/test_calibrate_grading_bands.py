@@ -0,0 +1,30 @@
+import numpy as np
+from scripts.calibrate_grading_bands import accept_band, reject_band
+
+
+def test_accept_band_is_lowest_threshold_meeting_precision():
+    similarity = np.array([0.9, 0.8, 0.7, 0.6, 0.5, 0.4])
+    correct = np.array([True, True, True, False, True, False])
+    assert accept_band(similarity, correct, 1.0, 1) == 0.7
+    assert accept_band(similarity, correct, 0.8, 1) == 0.5
+
+
+def test_reject_band_is_highest_threshold_meeting_precision():
+    similarity = np.array([0.1, 0.2, 0.3, 0.4, 0.9])
+    correct = np.array([False, False, False, True, True])
+    threshold = reject_band(similarity, correct, 1.0, 1)
+    assert 0.3 < threshold <= 0.3 + 1e-9
+    assert (similarity < threshold).sum() == 3
+
+
+def test_bands_need_min_support():
+    similarity = np.array([0.9, 0.1])
+    correct = np.array([True, False])
+    assert accept_band(similarity, correct, 1.0, 3) is None
+    assert reject_band(similarity, correct, 1.0, 3) is None
+
+
+def test_bands_do_not_split_tied_similarities():
+    similarity = np.array([0.8, 0.8, 0.2])
+    correct = np.array([True, False, False])
+    assert accept_band(similarity, correct, 1.0, 1) is None
@@ -0,0 +1,49 @@
+import numpy as np
+from utils.face_ann import BruteForceSearch, IVFSearch
+
+
+def clustered(size, dim=128, groups=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0, 1, size=(groups, dim)) / np.sqrt(dim)
+    rows = centres[rng.integers(0, groups, size)] + rng.normal(0, 0.3, size=(size, dim)) / np.sqrt(dim)
+    return rows.astype(np.float32)
+
+
+def test_ivf_top1_matches_brute_force_at_threshold():
+    matrix = clustered(3000)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, len(matrix), 200)
+    queries = matrix[picks] + rng.normal(0, 0.4, size=(200, matrix.shape[1])).astype(np.float32) / np.sqrt(128)
+    ivf, brute = IVFSearch(matrix, nprobe=1), BruteForceSearch()
+
+    for threshold in (0.45, 0.6):
+        for query in queries:
+            ivf_rows, ivf_dist = ivf.search(matrix, query, threshold, k=1)
+            brute_rows, brute_dist = brute.search(matrix, query, threshold, k=1)
+            assert list(ivf_rows) == list(brute_rows)
+            np.testing.assert_allclose(ivf_dist, brute_dist, rtol=1e-5)
+
+
+def test_ivf_top_k_within_threshold_matches_brute_force():
+    matrix = clustered(1000, seed=2)
+    ivf, brute = IVFSearch(matrix, nprobe=1), BruteForceSearch()
+    for query in matrix[:20]:
+        assert set(ivf.search(matrix, query, 0.5, k=5)[0]) == set(brute.search(matrix, query, 0.5, k=5)[0])
+
+
+def test_from_assignment_rebuilds_the_same_index():
+    matrix = clustered(800, seed=3)
+    built = IVFSearch(matrix)
+    restored = IVFSearch.from_assignment(built.centroids, built.assignment, built.centroid_dist)
+    for query in matrix[:20]:
+        assert list(restored.search(matrix, query, 0.6)[0]) == list(built.search(matrix, query, 0.6)[0])
+
+
+def test_added_rows_are_found():
+    matrix = clustered(500, seed=4)
+    ivf = IVFSearch(matrix)
+    extra = matrix[0] + 0.001
+    grown = np.vstack([matrix, extra])
+    ivf.add(len(matrix), extra)
+    rows, _ = ivf.search(grown, extra, 0.6)
+    assert rows[0] == len(matrix)
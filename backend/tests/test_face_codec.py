@@ -0,0 +1,27 @@
+import json
+import numpy as np
+import pytest
+from utils.face_codec import decode_facedata, encode_facedata, is_packed
+
+
+def test_packed_round_trip():
+    encoding = np.random.default_rng(0).normal(size=128).astype(np.float32)
+    packed = encode_facedata(encoding)
+    assert is_packed(packed)
+    np.testing.assert_array_equal(decode_facedata(packed), encoding)
+
+
+def test_legacy_formats_decode():
+    encoding = [float(i) / 128 for i in range(128)]
+    np.testing.assert_allclose(decode_facedata(encoding), encoding, rtol=1e-6)
+    np.testing.assert_allclose(decode_facedata(json.dumps(encoding)), encoding, rtol=1e-6)
+
+
+@pytest.mark.parametrize("facedata", [None, b"XX\x01\x00" + bytes(512), [0.0] * 127, "not json", b"FD\x01\x00"])
+def test_malformed_facedata_is_none(facedata):
+    assert decode_facedata(facedata) is None
+
+
+def test_wrong_dimension_is_rejected_on_encode():
+    with pytest.raises(ValueError):
+        encode_facedata(np.zeros(64))
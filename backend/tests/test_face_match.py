@@ -0,0 +1,36 @@
+import numpy as np
+from utils.face_match import assign_faces, match_faces, pairwise_distances
+
+
+def test_optimal_assignment_keeps_both_matches_greedy_would_drop():
+    # Greedy takes face 0 -> student 0 (0.1) and leaves face 1 with nobody
+    distances = np.array([[0.1, 0.3],
+                          [0.2, 0.9]])
+    assert list(assign_faces(distances, 0.45, "optimal")) == [1, 0]
+    assert list(assign_faces(distances, 0.45, "greedy")) == [0, -1]
+
+
+def test_pairs_at_or_beyond_tolerance_are_not_assigned():
+    distances = np.array([[0.45, 0.5],
+                          [0.7, 0.2]])
+    assert list(assign_faces(distances, 0.45)) == [-1, 1]
+
+
+def test_each_student_is_assigned_at_most_once():
+    distances = np.array([[0.1], [0.2], [0.3]])
+    assignment = assign_faces(distances, 0.45)
+    assert sorted(assignment) == [-1, -1, 0]
+
+
+def test_match_faces_reports_distance_of_assigned_row():
+    known = np.eye(3, 128, dtype=np.float32)
+    faces = known[[2, 0]] + 0.01
+    assignment, distances = match_faces(faces, known)
+    assert list(assignment) == [2, 0]
+    np.testing.assert_allclose(distances, pairwise_distances(faces, known)[[0, 1], [2, 0]])
+
+
+def test_match_faces_with_empty_cohort():
+    assignment, distances = match_faces(np.zeros((2, 128)), np.empty((0, 128), dtype=np.float32))
+    assert list(assignment) == [-1, -1]
+    assert np.isinf(distances).all()
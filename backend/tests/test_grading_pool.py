@@ -0,0 +1,67 @@
+import threading
+import time
+from utils.grading_pool import GradingPool
+
+
+class _Gauge:
+    """Counts calls in flight and remembers the peak."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def call(self, value, seconds=0.02):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(seconds)
+        with self._lock:
+            self.current -= 1
+        return value
+
+
+def test_results_follow_input_order_not_completion_order():
+    pool = GradingPool(max_concurrency=8)
+    items = [(i, 0.05 - i * 0.005) for i in range(8)]
+    assert pool.map(lambda value, seconds: time.sleep(seconds) or value, items, per_request=8) == list(range(8))
+
+
+def test_per_request_window_bounds_calls_in_flight():
+    pool, gauge = GradingPool(max_concurrency=8), _Gauge()
+    assert pool.map(gauge.call, [(i,) for i in range(10)], per_request=2) == list(range(10))
+    assert gauge.peak == 2
+
+
+def test_pool_size_caps_concurrency_across_requests():
+    pool, gauge = GradingPool(max_concurrency=3), _Gauge()
+    results = {}
+
+    def request(name):
+        results[name] = pool.map(gauge.call, [(i,) for i in range(6)], per_request=3)
+
+    threads = [threading.Thread(target=request, args=(name,)) for name in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"a": list(range(6)), "b": list(range(6))}
+    assert gauge.peak == 3
+
+
+def test_calls_past_the_timeout_or_raising_get_none():
+    pool, release = GradingPool(max_concurrency=4), threading.Event()
+
+    def grade(value):
+        if value == "slow":
+            release.wait(5)
+        if value == "bad":
+            raise RuntimeError("grader failed")
+        return value
+
+    started = time.monotonic()
+    try:
+        assert pool.map(grade, [("a",), ("slow",), ("bad",), ("b",)], per_request=4, timeout=0.2) == ["a", None, None, "b"]
+        assert time.monotonic() - started < 2
+    finally:
+        release.set()
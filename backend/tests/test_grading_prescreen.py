@@ -0,0 +1,47 @@
+import pytest
+import utils.grading_prescreen as prescreen
+from utils.grading_prescreen import SimilarityPrescreen
+
+
+class _Config:
+    def __init__(self, doc=None):
+        self.doc = doc
+
+    def find_one(self, query):
+        return self.doc
+
+
+@pytest.fixture
+def calibrated(monkeypatch):
+    monkeypatch.setattr(prescreen, "grading_config", _Config({"reject_below": 0.05, "accept_above": 0.8}))
+    return SimilarityPrescreen(enabled=True)
+
+
+def test_nothing_is_screened_until_bands_are_calibrated(monkeypatch):
+    monkeypatch.setattr(prescreen, "grading_config", _Config())
+    screen = SimilarityPrescreen(enabled=True)
+    assert screen.bands() is None
+    assert screen.screen([("q1", "glucose", "glucose"), ("q1", "zebra", "glucose")]) == [None, None]
+    assert screen.stats()["calibrated"] is False
+
+
+def test_calibrated_bands_accept_and_reject(calibrated):
+    verdicts = calibrated.screen([
+        ("q1", "plants make glucose from light", "plants make glucose from light"),
+        ("q1", "zebra", "plants make glucose from light"),
+    ])
+    assert verdicts == [True, False]
+
+
+@pytest.mark.parametrize("answer, reference", [
+    ("water does not boil at 100 degrees", "water does boil at 100 degrees"),
+    ("water does boil at 100 degrees", "water doesn't boil at 100 degrees"),
+    ("water boils at 90 degrees celsius", "water boils at 100 degrees celsius"),
+    ("water boils at degrees celsius", "water boils at 100 degrees celsius"),
+])
+def test_negation_or_number_mismatch_is_never_accepted(monkeypatch, answer, reference):
+    monkeypatch.setattr(prescreen, "grading_config", _Config({"reject_below": 0.0, "accept_above": 0.5}))
+    screen = SimilarityPrescreen(enabled=True)
+    assert prescreen.answer_similarity(reference, answer) >= 0.5
+    assert screen.screen([("q1", answer, reference)]) == [None]
+    assert screen.stats()["held_back_for_negation_or_numbers"] == 1
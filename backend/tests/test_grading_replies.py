@@ -0,0 +1,23 @@
+from utils.grading_replies import parse_batch_verdicts
+
+
+def test_verdicts_in_item_order():
+    data = {"verdicts": [{"item": 2, "grade": "Incorrect"}, {"item": 1, "grade": " correct "}]}
+    assert parse_batch_verdicts(data, 2) == [True, False]
+
+
+def test_missing_unknown_and_out_of_range_items_are_none():
+    data = {"verdicts": [{"item": 1, "grade": "Partially correct"}, {"item": 5, "grade": "Correct"},
+                         {"grade": "Correct"}, {"item": "x", "grade": "Correct"}, {"item": 3, "grade": "Correct"}]}
+    assert parse_batch_verdicts(data, 3) == [None, None, True]
+
+
+def test_first_verdict_for_an_item_wins():
+    data = {"verdicts": [{"item": 1, "grade": "Correct"}, {"item": 1, "grade": "Incorrect"}]}
+    assert parse_batch_verdicts(data, 1) == [True]
+
+
+def test_malformed_replies():
+    assert parse_batch_verdicts([], 2) == [None, None]
+    assert parse_batch_verdicts({"verdicts": "Correct"}, 1) == [None]
+    assert parse_batch_verdicts({}, 0) == []
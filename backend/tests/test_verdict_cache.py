@@ -0,0 +1,42 @@
+import pytest
+from utils.verdict_cache import critical_tokens, normalize_answer, verdict_key
+
+
+def test_normalize_answer_folds_case_spacing_and_closing_punctuation():
+    assert normalize_answer("  Photosynthesis\tmakes   GLUCOSE. ") == "photosynthesis makes glucose"
+    assert normalize_answer("Paris?") == normalize_answer("paris")
+
+
+@pytest.mark.parametrize("a, b", [
+    ("-5", "5"),
+    ("3.14", "314"),
+    ("x > 5", "x < 5"),
+    ("a + b", "a - b"),
+    ("C#", "C"),
+    ("C++", "C"),
+    ("2 * 3", "2 / 3"),
+    ("x = 1", "x 1"),
+    ("5!", "5"),
+])
+def test_meaningful_symbols_are_kept(a, b):
+    assert normalize_answer(a) != normalize_answer(b)
+
+
+def test_verdict_key_ignores_formatting_only_differences():
+    assert verdict_key("q1", "Glucose", "Makes glucose.", "v1") == verdict_key("q1", "glucose ", "makes  GLUCOSE", "v1")
+
+
+def test_verdict_key_depends_on_question_reference_and_grader():
+    key = verdict_key("q1", "glucose", "glucose", "v1")
+    assert key != verdict_key("q2", "glucose", "glucose", "v1")
+    assert key != verdict_key("q1", "oxygen", "glucose", "v1")
+    assert key != verdict_key("q1", "glucose", "glucose", "v2")
+    assert key != verdict_key("q1", "glucose", "sugar", "v1")
+    assert verdict_key("q1", "-5", "-5", "v1") != verdict_key("q1", "-5", "5", "v1")
+
+
+def test_critical_tokens_capture_negation_and_numbers():
+    assert critical_tokens("It isn't soluble") == critical_tokens("it is NOT soluble") == {"<not>"}
+    assert critical_tokens("boils at 100.0 degrees") == critical_tokens("boils at 100 degrees")
+    assert critical_tokens("-3 degrees") != critical_tokens("3 degrees")
+    assert critical_tokens("it is soluble") == frozenset()
@@ -0,0 +1,177 @@
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from flask import jsonify, make_response, request
+
+# Face requests one process serves at once; the remaining Flask threads stay
+# free for quiz, social and other light routes
+FACE_ADMISSION_MAX_CONCURRENT = int(os.getenv(
+    "FACE_ADMISSION_MAX_CONCURRENT", max(2 * int(os.getenv("FACE_COMPUTE_WORKERS", 2)), 2)
+))
+# Share of those slots one college may hold, so an exam-hall burst at one
+# college does not lock the others out
+FACE_ADMISSION_PER_COLID = int(os.getenv("FACE_ADMISSION_PER_COLID", max(FACE_ADMISSION_MAX_CONCURRENT // 2, 1)))
+# Requests allowed to wait briefly for a slot before being turned away
+FACE_ADMISSION_MAX_WAITING = int(os.getenv("FACE_ADMISSION_MAX_WAITING", FACE_ADMISSION_MAX_CONCURRENT))
+FACE_ADMISSION_WAIT_SECONDS = float(os.getenv("FACE_ADMISSION_WAIT_SECONDS", 0.5))
+
+RETRY_AFTER_MAX_SECONDS = 60
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason, retry_after)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Caps concurrent face requests per process and per colid. A request that
+    finds no free slot waits at most `wait_seconds` (and only while fewer
+    than `max_waiting` others are waiting), then gets AdmissionRejected with
+    a Retry-After estimate instead of tying up a Flask worker.
+    """
+
+    def __init__(self, max_concurrent=FACE_ADMISSION_MAX_CONCURRENT, per_colid=FACE_ADMISSION_PER_COLID,
+                 max_waiting=FACE_ADMISSION_MAX_WAITING, wait_seconds=FACE_ADMISSION_WAIT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.per_colid = per_colid
+        self.max_waiting = max_waiting
+        self.wait_seconds = wait_seconds
+        self._cond = threading.Condition()
+        self._active = 0
+        self._by_colid = Counter()
+        self._waiting = 0
+        # Moving average of how long an admitted request holds its slot
+        self._avg_seconds = 2.0
+        self.admitted = 0
+        self.rejected = Counter()
+
+    @staticmethod
+    def _key(colid):
+        colid = str(colid).strip() if colid is not None else ""
+        return colid or None
+
+    def _blocked_by(self, key):
+        if self._active >= self.max_concurrent:
+            return "process"
+        if key is not None and self._by_colid[key] >= self.per_colid:
+            return "colid"
+        return None
+
+    def retry_after(self):
+        """Seconds until a slot is likely free: queue ahead of us times the average hold."""
+        seconds = self._avg_seconds * (self._waiting + 1) / max(self.max_concurrent, 1)
+        return min(max(math.ceil(seconds), 1), RETRY_AFTER_MAX_SECONDS)
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(reason, self.retry_after())
+
+    def acquire(self, colid=None):
+        """Takes a slot or raises AdmissionRejected; returns a token for release()."""
+        key = self._key(colid)
+        with self._cond:
+            reason = self._blocked_by(key)
+            if reason is not None:
+                if self._waiting >= self.max_waiting or self.wait_seconds <= 0:
+                    self._reject(reason)
+                deadline = time.monotonic() + self.wait_seconds
+                self._waiting += 1
+                try:
+                    while reason is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject(reason)
+                        self._cond.wait(remaining)
+                        reason = self._blocked_by(key)
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            if key is not None:
+                self._by_colid[key] += 1
+            self.admitted += 1
+        return key, time.monotonic()
+
+    def release(self, token):
+        key, started = token
+        with self._cond:
+            self._active -= 1
+            if key is not None:
+                self._by_colid[key] -= 1
+                if self._by_colid[key] <= 0:
+                    del self._by_colid[key]
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.monotonic() - started)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, colid=None):
+        token = self.acquire(colid)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self._active,
+                "waiting": self._waiting,
+                "max_concurrent": self.max_concurrent,
+                "per_colid": self.per_colid,
+                "active_by_colid": dict(self._by_colid),
+                "admitted": self.admitted,
+                "rejected": sum(self.rejected.values()),
+                "rejected_by_reason": dict(self.rejected),
+                "avg_seconds": round(self._avg_seconds, 3),
+                "retry_after": self.retry_after(),
+            }
+
+
+face_admission_controller = AdmissionController()
+
+
+def request_colid(field="colid"):
+    """
+    The college a face request is admitted under: the `colid` query
+    argument, the X-Colid header or the `colid` form field, in that order.
+    Reading the form parses the multipart body first; MAX_CONTENT_LENGTH
+    bounds it and large parts spool to disk, and the view needs the form
+    anyway. Requests without any of them share only the global limit.
+    """
+    return request.args.get(field) or request.headers.get("X-Colid") or request.form.get(field)
+
+
+def busy_response(retry_after, reason="busy"):
+    response = jsonify({
+        "error": "Server is busy processing faces, please retry",
+        "reason": reason,
+        "retry_after": retry_after,
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def face_admission(view):
+    """
+    Runs a CPU-heavy face route under the admission controller. Rejected
+    requests get 503 with Retry-After; so do 503s the view returns itself
+    (e.g. a full face-compute queue).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            with face_admission_controller.admit(request_colid()):
+                response = make_response(view(*args, **kwargs))
+        except AdmissionRejected as e:
+            return busy_response(e.retry_after, e.reason)
+        if response.status_code == 503 and "Retry-After" not in response.headers:
+            response.headers["Retry-After"] = str(face_admission_controller.retry_after())
+        return response
+    return wrapper
@@ -0,0 +1,117 @@
+import os
+import random
+import zlib
+from collections import defaultdict
+import numpy as np
+from utils.verdict_cache import critical_tokens, normalize_answer
+
+# Answers at least this similar (shingle Jaccard) to a cluster's
+# representative, with the same negation and numbers, share its verdict
+ANSWER_CLUSTER_JACCARD = float(os.getenv("ANSWER_CLUSTER_JACCARD", 0.9))
+# Character shingle length
+ANSWER_CLUSTER_SHINGLE = int(os.getenv("ANSWER_CLUSTER_SHINGLE", 5))
+# Share of propagated verdicts graded on their own as well, to measure agreement
+ANSWER_CLUSTER_AUDIT_RATE = float(os.getenv("ANSWER_CLUSTER_AUDIT_RATE", 0.05))
+
+# MinHash signature = LSH_BANDS bands of LSH_ROWS rows. With 16 x 4, pairs at
+# Jaccard 0.8 and above collide in some band with probability ~1.0, pairs at 0.3 ~0.12
+LSH_BANDS = 16
+LSH_ROWS = 4
+_PRIME = (1 << 31) - 1
+
+
+def shingles(text, k=ANSWER_CLUSTER_SHINGLE):
+    """Hashed character k-shingles of the normalised answer; short answers are one shingle."""
+    text = normalize_answer(text)
+    if len(text) <= k:
+        return {zlib.crc32(text.encode())}
+    return {zlib.crc32(text[i:i + k].encode()) for i in range(len(text) - k + 1)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def minhash_signatures(shingle_sets, seed=0):
+    """(len(shingle_sets), LSH_BANDS * LSH_ROWS) MinHash signatures."""
+    rng = np.random.default_rng(seed)
+    perms = LSH_BANDS * LSH_ROWS
+    a = rng.integers(1, _PRIME, size=(perms, 1), dtype=np.int64)
+    b = rng.integers(0, _PRIME, size=(perms, 1), dtype=np.int64)
+    signatures = np.empty((len(shingle_sets), perms), dtype=np.int64)
+    for i, values in enumerate(shingle_sets):
+        x = np.fromiter(values, dtype=np.int64, count=len(values)) % _PRIME
+        signatures[i] = ((a * x + b) % _PRIME).min(axis=1)
+    return signatures
+
+
+def cluster_answers(texts, threshold=ANSWER_CLUSTER_JACCARD):
+    """
+    Groups near-duplicate answers to one question. Identical normalised
+    answers are merged first, MinHash/LSH proposes candidate pairs among the
+    rest, and each candidate is checked with exact shingle Jaccard and
+    must have the same critical_tokens (negation, numbers), since "x is
+    not 5" and "x is 5" can be near-duplicates by shingles alone.
+    Returns clusters as lists of indices into `texts`, representative
+    first; every member is within `threshold` of its representative.
+    """
+    by_text = defaultdict(list)
+    for i, text in enumerate(texts):
+        by_text[normalize_answer(text)].append(i)
+    groups = list(by_text.values())
+    sets = [shingles(texts[group[0]]) for group in groups]
+    critical = [critical_tokens(texts[group[0]]) for group in groups]
+
+    neighbours = defaultdict(set)
+    if len(groups) > 1:
+        signatures = minhash_signatures(sets)
+        for band in range(LSH_BANDS):
+            buckets = defaultdict(list)
+            rows = signatures[:, band * LSH_ROWS:(band + 1) * LSH_ROWS]
+            for g, row in enumerate(map(bytes, rows)):
+                buckets[row].append(g)
+            for bucket in buckets.values():
+                for x in range(len(bucket)):
+                    for y in range(x + 1, len(bucket)):
+                        g, h = bucket[x], bucket[y]
+                        if h in neighbours[g] or critical[g] != critical[h]:
+                            continue
+                        if jaccard(sets[g], sets[h]) >= threshold:
+                            neighbours[g].add(h)
+                            neighbours[h].add(g)
+
+    # Leader clustering: the group with the most answers around it leads,
+    # and takes only its own verified neighbours, so clusters stay tight
+    weight = {g: len(groups[g]) + sum(len(groups[h]) for h in neighbours[g]) for g in range(len(groups))}
+    unassigned = set(range(len(groups)))
+    clusters = []
+    for leader in sorted(range(len(groups)), key=lambda g: (-weight[g], g)):
+        if leader not in unassigned:
+            continue
+        members = [leader] + sorted(neighbours[leader] & unassigned)
+        unassigned.difference_update(members)
+        clusters.append([i for g in members for i in groups[g]])
+    return clusters
+
+
+def plan_clustered_grading(triples, threshold=ANSWER_CLUSTER_JACCARD, audit_rate=ANSWER_CLUSTER_AUDIT_RATE, seed=0):
+    """
+    Plans grading (question, answer, reference) triples by cluster.
+    Returns (leader, audit): leader[i] is the index whose verdict triple i
+    takes (i itself for representatives and singletons), and `audit` is a
+    sample of propagated indices to grade on their own as a check.
+    """
+    by_question = defaultdict(list)
+    for i, (question_text, _, reference) in enumerate(triples):
+        by_question[(question_text, reference)].append(i)
+
+    leader = list(range(len(triples)))
+    for indices in by_question.values():
+        for cluster in cluster_answers([triples[i][1] for i in indices], threshold):
+            for member in cluster[1:]:
+                leader[indices[member]] = indices[cluster[0]]
+
+    propagated = [i for i, lead in enumerate(leader) if lead != i]
+    audit_size = min(len(propagated), int(np.ceil(len(propagated) * audit_rate))) if audit_rate > 0 else 0
+    audit = set(random.Random(seed).sample(propagated, audit_size))
+    return leader, audit
@@ -0,0 +1,236 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import numpy as np
+from pymongo import MongoClient
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from utils.app_dirs import APP_DATA_DIR, UnsafeDirectory, private_dir
+
+client = MongoClient(os.getenv("MONGO_URI"))
+db = client[os.getenv("DB_NAME")]
+
+# Shared by every worker on the host; a model written here by one worker or
+# by scripts/fit_answer_models.py is picked up by the others. Must be private
+# to the app's user (see utils/app_dirs.py) or models are not loaded
+ANSWER_MODEL_DIR = os.getenv("ANSWER_MODEL_DIR", os.path.join(APP_DATA_DIR, "answer_models"))
+# How often a loaded model's file is checked for a newer fit
+ANSWER_MODEL_CHECK_SECONDS = float(os.getenv("ANSWER_MODEL_CHECK_SECONDS", 30))
+
+QUESTION_COLLECTIONS = ("quizzes", "scheduled_quizzes", "assignments", "scheduled_assignments")
+
+
+def model_key(colid):
+    """Normalises a colid (int on quizzes, str on assignments) to one key."""
+    colid = str(colid).strip() if colid is not None else ""
+    return str(int(colid)) if colid.isdigit() else colid
+
+
+def question_bank(colid):
+    """(question id, reference answer) of every descriptive question a college has set."""
+    key = model_key(colid)
+    colids = [key, int(key)] if key.isdigit() else [key]
+    bank = {}
+    for name in QUESTION_COLLECTIONS:
+        for item in db[name].find({"colid": {"$in": colids}}, {"questions": 1}):
+            for q in item.get("questions", []):
+                reference = (q.get("answer") or "").strip().lower()
+                if q.get("id") and reference and not q.get("options"):
+                    bank[str(q["id"])] = reference
+    return list(bank.items())
+
+
+class AnswerModel:
+    """
+    A TF-IDF vectorizer fitted over one college's reference answers, with
+    every reference already vectorised. Rows are L2-normalised, so a
+    similarity is a sparse row dot product. `texts` are the normalised
+    reference answers the rows were fitted on.
+    """
+
+    def __init__(self, colid, vectorizer, question_ids, references, version, texts):
+        self.colid = model_key(colid)
+        self.vectorizer = vectorizer
+        self.question_ids = list(question_ids)
+        self.references = references
+        self.version = version
+        self.texts = list(texts)
+        self._rows = {question_id: i for i, question_id in enumerate(self.question_ids)}
+
+    @classmethod
+    def fit(cls, colid, bank):
+        """Fits a model on (question id, reference answer) pairs."""
+        question_ids = [question_id for question_id, _ in bank]
+        vectorizer = TfidfVectorizer(sublinear_tf=True)
+        texts = [reference for _, reference in bank]
+        references = vectorizer.fit_transform(texts).tocsr()
+        return cls(colid, vectorizer, question_ids, references, int(time.time()), texts)
+
+    def __contains__(self, question_id):
+        return str(question_id) in self._rows
+
+    def reference(self, question_id):
+        """The reference answer a question was fitted with, or None."""
+        row = self._rows.get(str(question_id))
+        return None if row is None else self.texts[row]
+
+    def score(self, question_ids, answers):
+        """
+        Cosine similarity of each answer to its question's reference, as
+        one array; NaN where the question is not in the model.
+        """
+        rows = np.array([self._rows.get(str(question_id), -1) for question_id in question_ids], dtype=np.int64)
+        similarity = np.full(len(rows), np.nan)
+        known = np.flatnonzero(rows >= 0)
+        if len(known):
+            vectors = self.vectorizer.transform([answers[i] or "" for i in known])
+            similarity[known] = np.asarray(vectors.multiply(self.references[rows[known]]).sum(axis=1)).ravel()
+        return similarity
+
+    def score_text(self, reference, answer):
+        """Similarity of an answer to a reference the model has not seen, with the college's IDF."""
+        vectors = self.vectorizer.transform([reference or "", answer or ""])
+        return float(vectors[0].multiply(vectors[1]).sum())
+
+    def info(self):
+        return {
+            "colid": self.colid,
+            "version": self.version,
+            "questions": len(self.question_ids),
+            "vocabulary": len(self.vectorizer.vocabulary_),
+        }
+
+
+def _model_stem(key):
+    return re.sub(r"[^\w-]", "_", key or "_")
+
+
+def _write_atomic(directory, name, write):
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, os.path.join(directory, name))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_model(directory, model):
+    """
+    Stores a model as plain data: the vocabulary, IDF weights and reference
+    texts in <colid>.json, the reference matrix in <colid>-v<version>.npz.
+    The JSON file is replaced last, so readers never see a half-written model.
+    """
+    private_dir(directory)
+    stem = _model_stem(model.colid)
+    matrix_name = f"{stem}-v{model.version}.npz"
+    references = model.references.tocsr()
+    _write_atomic(directory, matrix_name, lambda f: np.savez(
+        f, data=references.data, indices=references.indices, indptr=references.indptr,
+        shape=np.array(references.shape)))
+    header = {
+        "colid": model.colid,
+        "version": model.version,
+        "matrix": matrix_name,
+        "question_ids": model.question_ids,
+        "texts": model.texts,
+        "vocabulary": {term: int(column) for term, column in model.vectorizer.vocabulary_.items()},
+        "idf": model.vectorizer.idf_.tolist(),
+    }
+    _write_atomic(directory, stem + ".json", lambda f: f.write(json.dumps(header).encode()))
+
+    for name in os.listdir(directory):
+        if name.startswith(stem + "-v") and name.endswith(".npz") and name != matrix_name:
+            os.unlink(os.path.join(directory, name))
+
+
+def read_model(directory, key):
+    """Loads a model written by write_model; the vectorizer is rebuilt from its vocabulary and IDF."""
+    with open(os.path.join(directory, _model_stem(key) + ".json")) as f:
+        header = json.load(f)
+    with np.load(os.path.join(directory, os.path.basename(header["matrix"])), allow_pickle=False) as parts:
+        references = sparse.csr_matrix((parts["data"], parts["indices"], parts["indptr"]),
+                                       shape=tuple(parts["shape"]))
+    vectorizer = TfidfVectorizer(sublinear_tf=True)
+    vectorizer.vocabulary_ = header["vocabulary"]
+    vectorizer.idf_ = np.asarray(header["idf"], dtype=np.float64)
+    if references.shape != (len(header["question_ids"]), len(header["idf"])):
+        raise ValueError(f"reference matrix {references.shape} does not match the model header")
+    return AnswerModel(header["colid"], vectorizer, header["question_ids"], references,
+                       header["version"], header["texts"])
+
+
+class AnswerModelStore:
+    """
+    Per-college AnswerModels on disk, loaded on first use. A model whose
+    file has been replaced is reloaded on the next lookup after
+    ANSWER_MODEL_CHECK_SECONDS, so refits take effect without a restart.
+    """
+
+    def __init__(self, directory=ANSWER_MODEL_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._models = {}
+        self._checked = {}
+
+    def get(self, colid):
+        """The current model for a college, or None if none has been fitted."""
+        key = model_key(colid)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._models.get(key)
+            if entry and now - self._checked.get(key, 0) < ANSWER_MODEL_CHECK_SECONDS:
+                return entry[1]
+            self._checked[key] = now
+
+        path = os.path.join(self.directory, _model_stem(key) + ".json")
+        try:
+            private_dir(self.directory)
+            mtime = os.stat(path).st_mtime_ns
+        except UnsafeDirectory as e:
+            print("Answer models disabled:", e)
+            return None
+        except OSError:
+            with self._lock:
+                self._models.pop(key, None)
+            return None
+        if entry and entry[0] == mtime:
+            return entry[1]
+
+        try:
+            model = read_model(self.directory, key)
+        except Exception as e:
+            print(f"Loading answer model {path} failed:", e)
+            return entry[1] if entry else None
+        with self._lock:
+            self._models[key] = (mtime, model)
+        print(f"Loaded answer model for colid {key} v{model.version} ({len(model.question_ids)} questions)")
+        return model
+
+    def save(self, model):
+        """Writes a model atomically and swaps it in for this process."""
+        write_model(self.directory, model)
+        path = os.path.join(self.directory, _model_stem(model.colid) + ".json")
+        with self._lock:
+            self._models[model.colid] = (os.stat(path).st_mtime_ns, model)
+            self._checked[model.colid] = time.monotonic()
+
+    def refit(self, colid):
+        """Fits a college's model from its current question bank and saves it; None if it has no references."""
+        bank = question_bank(colid)
+        if not bank:
+            return None
+        model = AnswerModel.fit(colid, bank)
+        self.save(model)
+        return model
+
+    def loaded(self):
+        with self._lock:
+            return [model.info() for _, model in self._models.values()]
+
+
+answer_models = AnswerModelStore()
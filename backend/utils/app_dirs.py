@@ -0,0 +1,29 @@
+import os
+import stat
+
+# Root for files the app writes and later loads back as trusted data (face
+# index snapshots, answer models). Must not be writable by other users
+APP_DATA_DIR = os.getenv("APP_DATA_DIR", os.path.join(os.path.expanduser("~"), ".lms"))
+
+
+class UnsafeDirectory(OSError):
+    """A data directory that other users could have written to."""
+
+
+def private_dir(path):
+    """
+    Creates `path` with mode 0700 if it is missing and returns it. Raises
+    UnsafeDirectory unless it is a real directory owned by this user that
+    no other user can write to; group/other read bits are dropped.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise UnsafeDirectory(f"{path} is not a directory")
+    if info.st_uid != os.getuid():
+        raise UnsafeDirectory(f"{path} is owned by uid {info.st_uid}, not this user")
+    if info.st_mode & 0o022:
+        raise UnsafeDirectory(f"{path} is writable by other users; remove it or chmod 700 it after checking its contents")
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
@@ -0,0 +1,183 @@
+import os
+import numpy as np
+
+# "brute", "ivf" or "auto" (IVF once the index holds FACE_ANN_MIN_SIZE faces)
+FACE_ANN_BACKEND = os.getenv("FACE_ANN_BACKEND", "auto").lower()
+FACE_ANN_MIN_SIZE = int(os.getenv("FACE_ANN_MIN_SIZE", 20000))
+FACE_ANN_NPROBE = int(os.getenv("FACE_ANN_NPROBE", 8))
+# Slack added to every pruning bound. Centroid and row distances are float32,
+# so a lower bound can come out a few ulps above the exact distance of a row
+# sitting right at the threshold; pruning it would lose a true match.
+PRUNE_MARGIN = 1e-4
+
+
+class BruteForceSearch:
+    """Exact scan over every row; the reference the ANN backends are measured against."""
+
+    name = "brute"
+
+    def add(self, row, vector):
+        pass
+
+    def search(self, matrix, query, threshold, k=1):
+        """
+        Returns (rows, distances) of the k closest rows within `threshold`,
+        closest first.
+        """
+        if len(matrix) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        distances = np.linalg.norm(matrix - query, axis=1)
+        return _top_k(np.arange(len(matrix)), distances, threshold, k)
+
+
+class IVFSearch:
+    """
+    Inverted-file index: rows are bucketed under k-means centroids and a query
+    only scans the buckets that can hold a match.
+
+    The nearest `nprobe` buckets are scanned first and re-ranked exactly. Any
+    other bucket is then scanned only if the triangle inequality says it may
+    still hold a row closer than both the best hit so far and `threshold`
+    (distance to centroid minus bucket radius). Every row within `threshold`
+    is therefore reachable, so top-k recall at the threshold matches
+    BruteForceSearch exactly.
+    """
+
+    name = "ivf"
+
+    def __init__(self, matrix, nlist=None, nprobe=FACE_ANN_NPROBE, iterations=10, seed=0):
+        size = len(matrix)
+        nlist = nlist or max(1, int(np.sqrt(size)))
+        centroids = _kmeans(matrix, nlist, iterations, seed)
+        assignment, centroid_dist = _assign(matrix, centroids)
+        self._bucket(centroids, assignment, centroid_dist, nprobe)
+
+    @classmethod
+    def from_assignment(cls, centroids, assignment, centroid_dist, nprobe=FACE_ANN_NPROBE):
+        """
+        Rebuilds the index from centroids and row assignments saved with a
+        face snapshot, skipping k-means. Also works for a contiguous slice
+        of the rows (one college's partition) with the same centroids.
+        """
+        search = cls.__new__(cls)
+        search._bucket(np.asarray(centroids, dtype=np.float32), np.asarray(assignment, dtype=np.int64),
+                       np.asarray(centroid_dist, dtype=np.float32), nprobe)
+        return search
+
+    def _bucket(self, centroids, assignment, centroid_dist, nprobe):
+        self.centroids = centroids
+        self.nlist = len(centroids)
+        self.nprobe = nprobe
+        self.assignment = assignment
+        self.centroid_dist = centroid_dist
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+
+        self._rows = []
+        self._row_dist = []
+        self.radius = np.zeros(self.nlist, dtype=np.float32)
+        for c in range(self.nlist):
+            members = order[bounds[c]:bounds[c + 1]]
+            self._rows.append(members.astype(np.int64))
+            self._row_dist.append(centroid_dist[members])
+            if len(members):
+                self.radius[c] = centroid_dist[members].max()
+
+    def add(self, row, vector):
+        distances = np.linalg.norm(self.centroids - vector, axis=1)
+        c = int(np.argmin(distances))
+        self._rows[c] = np.append(self._rows[c], row)
+        self._row_dist[c] = np.append(self._row_dist[c], distances[c])
+        self.radius[c] = max(self.radius[c], distances[c])
+
+    def _scan(self, matrix, query, c, query_dist, bound):
+        rows = self._rows[c]
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        # |d(q, centroid) - d(x, centroid)| is a lower bound on d(q, x)
+        keep = np.abs(self._row_dist[c].astype(np.float64) - query_dist) <= bound + PRUNE_MARGIN
+        rows = rows[keep]
+        return rows, np.linalg.norm(matrix[rows] - query, axis=1)
+
+    def search(self, matrix, query, threshold, k=1):
+        centroid_dist = np.linalg.norm(self.centroids.astype(np.float64) - query, axis=1)
+        probe_order = np.argsort(centroid_dist)
+
+        found_rows, found_dist = [], []
+        best = np.inf
+        for c in probe_order[:self.nprobe]:
+            rows, dist = self._scan(matrix, query, c, centroid_dist[c], threshold)
+            found_rows.append(rows)
+            found_dist.append(dist)
+            if len(dist):
+                best = min(best, float(dist.min()))
+
+        # With k > 1 every row under the threshold must be considered
+        bound = min(best, threshold) if k == 1 else threshold
+        for c in probe_order[self.nprobe:]:
+            if centroid_dist[c] - self.radius[c] > bound + PRUNE_MARGIN:
+                continue
+            rows, dist = self._scan(matrix, query, c, centroid_dist[c], bound)
+            found_rows.append(rows)
+            found_dist.append(dist)
+
+        if not found_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # A re-enrolled row can sit in two buckets; keep one copy
+        rows, first = np.unique(np.concatenate(found_rows), return_index=True)
+        return _top_k(rows, np.concatenate(found_dist)[first], threshold, k)
+
+
+def _top_k(rows, distances, threshold, k):
+    within = distances <= threshold
+    rows, distances = rows[within], distances[within]
+    if len(rows) > k:
+        part = np.argpartition(distances, k - 1)[:k]
+        rows, distances = rows[part], distances[part]
+    order = np.argsort(distances)
+    return rows[order], distances[order]
+
+
+def _assign(matrix, centroids):
+    # Squared distances via one matrix product, processed in chunks to cap memory
+    centroid_sq = (centroids ** 2).sum(axis=1)
+    assignment = np.empty(len(matrix), dtype=np.int64)
+    distance = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), 65536):
+        chunk = matrix[start:start + 65536]
+        sq = (chunk ** 2).sum(axis=1)[:, None] - 2 * chunk @ centroids.T + centroid_sq
+        nearest = np.argmin(sq, axis=1)
+        assignment[start:start + len(chunk)] = nearest
+        distance[start:start + len(chunk)] = np.sqrt(np.maximum(sq[np.arange(len(chunk)), nearest], 0))
+    return assignment, distance
+
+
+def _kmeans(matrix, nlist, iterations, seed):
+    rng = np.random.default_rng(seed)
+    # Train on a sample; centroids only need to partition the space roughly
+    sample_size = min(len(matrix), nlist * 64)
+    sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), min(nlist, len(sample)), replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment, _ = _assign(sample, centroids)
+        for c in range(len(centroids)):
+            members = sample[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids.astype(np.float32)
+
+
+def wants_ivf(size, backend=None):
+    """Whether FACE_ANN_BACKEND picks IVF for a matrix of `size` rows."""
+    backend = (backend or FACE_ANN_BACKEND).lower()
+    if backend == "auto":
+        backend = "ivf" if size >= FACE_ANN_MIN_SIZE else "brute"
+    return backend == "ivf" and size > 0
+
+
+def build_search(matrix, backend=None):
+    """Picks the search backend for a matrix according to FACE_ANN_BACKEND."""
+    if wants_ivf(len(matrix), backend):
+        return IVFSearch(matrix)
+    return BruteForceSearch()
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Byte budget for all cached cohort matrices (default 64 MB)
+FACE_CACHE_MAX_BYTES = int(os.getenv("FACE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Entries older than this are reloaded so registrations handled by other
+# worker processes still show up eventually
+FACE_CACHE_TTL_SECONDS = float(os.getenv("FACE_CACHE_TTL_SECONDS", 300))
+
+
+def cohort_key(colid, program_code, year):
+    """Normalises request parameters the same way the users query matches them."""
+    if isinstance(colid, str) and colid.strip().isdigit():
+        colid = int(colid)
+    program_code = (program_code or "").strip().lower()
+    year = str(year).strip().lower() if year else None
+    return colid, program_code, year
+
+
+class CohortFaceCache:
+    """
+    LRU cache of ready-made encoding matrices per (colid, programcode,
+    admissionyear), bounded by a total byte budget.
+    """
+
+    def __init__(self, max_bytes=FACE_CACHE_MAX_BYTES, ttl=FACE_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(encs, names, ids):
+        # Matrix bytes plus a rough per-student overhead for names and ObjectIds
+        return encs.nbytes + sum(len(n) + 64 for n in names) + 72 * len(ids)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry["loaded_at"] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["encs"], entry["names"], entry["ids"]
+
+    def put(self, key, encs, names, ids):
+        size = self._entry_size(encs, names, ids)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            while self._bytes + size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["size"]
+                self.evictions += 1
+            self._entries[key] = {
+                "encs": encs,
+                "names": names,
+                "ids": ids,
+                "size": size,
+                "loaded_at": time.monotonic(),
+            }
+            self._bytes += size
+
+    def invalidate(self, colid, program_code, year=None):
+        """
+        Drops every cached cohort a student with these attributes belongs to,
+        including the year-less query for the same program.
+        """
+        colid, program_code, year = cohort_key(colid, program_code, year)
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == colid and key[1] == program_code and key[2] in (None, year):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+cohort_cache = CohortFaceCache()
@@ -0,0 +1,49 @@
+import json
+import numpy as np
+from bson.binary import Binary, USER_DEFINED_SUBTYPE
+
+ENCODING_DIM = 128
+
+# 4-byte header: magic, format version, reserved. Four bytes keeps the
+# float32 payload aligned for np.frombuffer.
+FACEDATA_MAGIC = b"FD"
+FACEDATA_VERSION = 1
+FACEDATA_HEADER = FACEDATA_MAGIC + bytes([FACEDATA_VERSION, 0])
+FACEDATA_DTYPE = np.dtype("<f4")
+
+
+def encode_facedata(encoding):
+    """Packs a face encoding as a versioned little-endian float32 bson.Binary."""
+    payload = np.asarray(encoding, dtype=FACEDATA_DTYPE).reshape(-1)
+    if payload.shape != (ENCODING_DIM,):
+        raise ValueError(f"Expected a {ENCODING_DIM}-d face encoding, got shape {payload.shape}")
+    return Binary(FACEDATA_HEADER + payload.tobytes(), USER_DEFINED_SUBTYPE)
+
+
+def decode_facedata(facedata):
+    """
+    Returns a stored `facedata` value as a float32 vector, or None if it is
+    missing or malformed. Handles the packed binary format as well as the
+    legacy list-of-floats and JSON-string formats.
+    """
+    if facedata is None:
+        return None
+    try:
+        if isinstance(facedata, (bytes, bytearray)):
+            if bytes(facedata[:3]) != FACEDATA_HEADER[:3]:
+                return None
+            encoding = np.frombuffer(facedata, dtype=FACEDATA_DTYPE, offset=len(FACEDATA_HEADER))
+        else:
+            if isinstance(facedata, str):
+                facedata = json.loads(facedata)
+            encoding = np.asarray(facedata, dtype=np.float32)
+    except (TypeError, ValueError):
+        return None
+
+    if encoding.shape != (ENCODING_DIM,):
+        return None
+    return encoding
+
+
+def is_packed(facedata):
+    return isinstance(facedata, (bytes, bytearray)) and bytes(facedata[:3]) == FACEDATA_HEADER[:3]
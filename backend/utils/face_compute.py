@@ -0,0 +1,305 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from utils.face_prefilter import (
+    FACE_PREFILTER, PrefilterRejected, _get_cascade, crop_to_face, find_portrait_face, prefilter_stats
+)
+from utils.face_profiles import FaceProfile, select_profile
+from utils.image_ingest import InvalidImage, decode_rgb, image_size
+from utils.video_attendance import track_and_encode_video
+
+# dlib worker processes per web process. Every gunicorn worker starts its own
+# pool, so size it to about cores / web workers; the default stays small so
+# several web workers do not oversubscribe the host
+FACE_COMPUTE_WORKERS = int(os.getenv("FACE_COMPUTE_WORKERS", 2))
+# Jobs allowed to wait or run at once before new work is refused
+FACE_COMPUTE_MAX_PENDING = int(os.getenv("FACE_COMPUTE_MAX_PENDING", FACE_COMPUTE_WORKERS * 4))
+FACE_COMPUTE_TIMEOUT = float(os.getenv("FACE_COMPUTE_TIMEOUT", 30))
+FACE_VIDEO_TIMEOUT = float(os.getenv("FACE_VIDEO_TIMEOUT", 180))
+
+
+class FaceComputeError(Exception):
+    pass
+
+
+class FaceComputeBusy(FaceComputeError):
+    pass
+
+
+class FaceComputeTimeout(FaceComputeError):
+    pass
+
+
+def _init_worker():
+    # Importing face_recognition loads the dlib detector, landmark and
+    # encoder models; one tiny call warms them up before the first request
+    import face_recognition
+    face_recognition.face_locations(np.zeros((32, 32, 3), dtype=np.uint8))
+    if FACE_PREFILTER:
+        _get_cascade()
+
+
+def _detect_and_encode(img, profile, detect_img=None):
+    """
+    Detects faces on `detect_img` (a reduced decode of `img`, if the caller
+    has one) shrunk to the profile's detection size, and encodes them from
+    the full-resolution `img`.
+    """
+    import cv2
+    import face_recognition
+
+    small = img if detect_img is None else detect_img
+    scale = profile.detect_scale(small.shape)
+    if scale != 1.0:
+        small = cv2.resize(small, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    locations = face_recognition.face_locations(small, profile.upsample, profile.model)
+    height, width = img.shape[:2]
+    scale_y, scale_x = small.shape[0] / height, small.shape[1] / width
+    if (scale_y, scale_x) != (1.0, 1.0):
+        locations = [
+            (max(int(top / scale_y), 0), min(int(right / scale_x), width),
+             min(int(bottom / scale_y), height), max(int(left / scale_x), 0))
+            for top, right, bottom, left in locations
+        ]
+
+    # Encoding runs on the full image rather than the detection copy: the
+    # profiles' accuracy assumes full-resolution face chips, and it only
+    # samples a 150x150 chip per face, so its cost does not grow with the
+    # photo size
+    return face_recognition.face_encodings(img, locations, profile.num_jitters, profile.landmark_model)
+
+
+def _detect_and_encode_image(source, purpose, expected_faces=None):
+    """
+    Detects faces on a decode at the lowest JPEG reduction that still
+    covers the profile's detection resolution, then encodes them from a
+    full-resolution decode. Small photos are decoded once.
+    """
+    try:
+        width, height = image_size(source)
+    except Exception:
+        raise InvalidImage("Invalid image format")
+    profile = select_profile((height, width), expected_faces, purpose)
+    detect_img = decode_rgb(source, profile.detect_max_side, (width, height))
+    if detect_img.shape[:2] == (height, width):
+        return _detect_and_encode(detect_img, profile)
+    return _detect_and_encode(decode_rgb(source), profile, detect_img)
+
+
+def _prefilter_and_encode_portrait(source, purpose):
+    """
+    Login/registration path: a Haar cascade plus blur and size checks run
+    first and reject unusable frames in a few milliseconds. Only frames with
+    one likely face reach dlib, and then only a tight crop around it.
+    """
+    try:
+        width, height = image_size(source)
+    except Exception:
+        raise InvalidImage("Invalid image format")
+    profile = select_profile((height, width), 1, purpose)
+    # Full resolution: the crop is what gets encoded, and the cascade
+    # shrinks its own grayscale copy
+    img = decode_rgb(source)
+
+    crop, upsample = crop_to_face(img, find_portrait_face(img))
+    crop_profile = FaceProfile(
+        profile.name, None, profile.model, max(profile.upsample, upsample),
+        profile.num_jitters, profile.landmark_model
+    )
+    return _detect_and_encode(crop, crop_profile)
+
+
+class FaceComputeExecutor:
+    """
+    Process pool for dlib work so CPU-heavy detection and encoding never runs
+    inside a Flask request thread. The queue is bounded: once
+    FACE_COMPUTE_MAX_PENDING jobs are in flight, new jobs fail fast with
+    FaceComputeBusy instead of piling up.
+    """
+
+    def __init__(self, workers=FACE_COMPUTE_WORKERS, max_pending=FACE_COMPUTE_MAX_PENDING,
+                 timeout=FACE_COMPUTE_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._in_flight = 0
+        self.busy_rejections = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            return self._pool
+
+    def _reset_pool(self, pool):
+        if pool is None:
+            return
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _release_slot(self, _=None):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.busy_rejections += 1
+            raise FaceComputeBusy("Face processing queue is full")
+        with self._lock:
+            self._in_flight += 1
+        pool = self._get_pool()
+        try:
+            future = pool.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._release_slot()
+            self._reset_pool(pool)
+            raise FaceComputeError("Face processing pool crashed, please retry")
+        except Exception:
+            self._release_slot()
+            raise
+        future.add_done_callback(self._release_slot)
+        return future
+
+    def result(self, future, timeout=None):
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            # A job that already started keeps its worker until it finishes,
+            # but the request no longer waits for it
+            future.cancel()
+            raise FaceComputeTimeout("Face processing timed out")
+        except BrokenProcessPool:
+            self._reset_pool(self._pool)
+            raise FaceComputeError("Face processing pool crashed, please retry")
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        return self.result(self.submit(fn, *args, **kwargs), timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "max_pending": self.max_pending,
+                "busy_rejections": self.busy_rejections,
+            }
+
+
+face_compute = FaceComputeExecutor()
+
+
+def encode_faces(source, purpose="login"):
+    """
+    Decodes an upload (bytes or spooled file path), finds every face and
+    encodes it on the face-compute pool. Login and registration photos go
+    through the cascade pre-filter first; PrefilterRejected is raised for
+    frames it turns away.
+    """
+    if not FACE_PREFILTER or purpose not in ("login", "register"):
+        return face_compute.run(_detect_and_encode_image, source, purpose)
+
+    started = time.perf_counter()
+    try:
+        encodings = face_compute.run(_prefilter_and_encode_portrait, source, purpose)
+    except PrefilterRejected as e:
+        prefilter_stats.record(time.perf_counter() - started, reason=e.reason)
+        raise
+    prefilter_stats.record(time.perf_counter() - started, found=bool(encodings))
+    return encodings
+
+
+def detect_and_encode_image(source, expected_faces=None, purpose="attendance"):
+    """encode_faces() for classroom photos, tuned by the expected head count."""
+    return face_compute.run(_detect_and_encode_image, source, purpose, expected_faces)
+
+
+def encode_video_tracks(path, expected_faces=None):
+    """Tracks and encodes the faces in a video file on the face-compute pool."""
+    return face_compute.run(track_and_encode_video, path, expected_faces, timeout=FACE_VIDEO_TIMEOUT)
+
+
+def _run_windowed(fn, items, args=(), window=None):
+    """
+    Runs fn(source, *args) for a stream of (tag, source) items on the pool,
+    keeping at most `window` of them (never more than the pool's
+    max_pending) in flight. Yields (tag, result) in input order; result is
+    the exception instead when that one item failed.
+    """
+    window = max(min(window or face_compute.workers * 2, face_compute.max_pending), 1)
+    pending = deque()
+
+    def finish_oldest():
+        tag, future = pending.popleft()
+        try:
+            return tag, face_compute.result(future)
+        except FaceComputeTimeout as e:
+            return tag, e
+        except FaceComputeError:
+            raise
+        except Exception as e:
+            return tag, e
+
+    try:
+        for tag, source in items:
+            waited = 0.0
+            while True:
+                try:
+                    pending.append((tag, face_compute.submit(fn, source, *args)))
+                    break
+                except FaceComputeBusy:
+                    # Other requests hold the free slots; wait for our own
+                    # jobs first, then for theirs up to the usual timeout
+                    if pending:
+                        yield finish_oldest()
+                    elif waited >= face_compute.timeout:
+                        raise
+                    else:
+                        time.sleep(0.1)
+                        waited += 0.1
+            if len(pending) >= window:
+                yield finish_oldest()
+        while pending:
+            yield finish_oldest()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def encode_faces_iter(items, purpose="register", window=None):
+    """
+    Encodes a long stream of (tag, source) uploads on the pool, keeping at
+    most `window` jobs in flight so memory stays bounded. Yields (tag,
+    encodings) in input order; encodings is the exception instead when that
+    one photo failed (bad image, pre-filter rejection, timeout).
+    """
+    if FACE_PREFILTER and purpose in ("login", "register"):
+        fn = _prefilter_and_encode_portrait
+    else:
+        fn = _detect_and_encode_image
+    return _run_windowed(fn, items, (purpose,), window)
+
+
+def detect_and_encode_many(sources, expected_faces=None, purpose="attendance"):
+    """
+    Encodes several uploads in parallel, at most the pool's max_pending at a
+    time so a batch larger than the queue waits instead of being refused.
+    Returns one list of encodings per image, or the exception raised for
+    that image so one corrupt photo does not fail the whole batch.
+    """
+    items = enumerate(sources)
+    return [
+        result for _, result in
+        _run_windowed(_detect_and_encode_image, items, (purpose, expected_faces), face_compute.max_pending)
+    ]
@@ -0,0 +1,370 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from pymongo import MongoClient
+from utils.face_ann import BruteForceSearch, IVFSearch, build_search, wants_ivf
+from utils.face_codec import ENCODING_DIM, decode_facedata
+from utils.face_match import pairwise_distances
+from utils.face_snapshot import (
+    FACE_SNAPSHOT_DIR, acquire_build_lock, append_delta, load_snapshot, partition_key,
+    read_delta, read_manifest, release_build_lock, write_snapshot
+)
+
+client = MongoClient(os.getenv("MONGO_URI"))
+db = client[os.getenv("DB_NAME")]
+
+# Same cut-off face_recognition.compare_faces uses by default
+FACE_LOGIN_TOLERANCE = 0.6
+# 1:1 verification against a user-supplied hint (email/regno) is a weaker
+# identity claim than a password, so it accepts only much closer faces
+FACE_VERIFY_TOLERANCE = float(os.getenv("FACE_VERIFY_TOLERANCE", 0.5))
+# sync() re-reads users whose facedata changed this long before the previous
+# sync, so writes from other workers that commit late are not missed
+FACE_SYNC_OVERLAP_SECONDS = int(os.getenv("FACE_SYNC_OVERLAP_SECONDS", 300))
+# How often sync() checks whether a newer snapshot has been written
+FACE_SNAPSHOT_CHECK_SECONDS = float(os.getenv("FACE_SNAPSHOT_CHECK_SECONDS", 60))
+
+
+class FaceIndex:
+    """
+    Keeps every enrolled face encoding in contiguous float32 matrices with
+    parallel arrays of user ids, so a login is a single vectorized distance
+    computation instead of a per-user Python loop.
+
+    The bulk of the index is a read-only base matrix memory-mapped from an
+    on-disk snapshot (see utils/face_snapshot.py) and shared by every worker
+    through the OS page cache. Registrations since the snapshot live in a
+    small in-memory tail. A user in the tail supersedes their base row, so
+    re-enrolled faces take effect before the next snapshot.
+
+    Snapshot rows are grouped by college, so a login scoped to one colid
+    searches only that college's slice of the base matrix plus its own
+    rows of the tail.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.RLock()
+        self._base = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        self._base_ids = np.empty(0, dtype=object)
+        self._base_search = BruteForceSearch()
+        self._partitions = {}
+        self._partition_search = {}
+        self._ivf = None
+        self._version = None
+        self._snapshot_checked = 0.0
+        self._matrix = np.empty((capacity, ENCODING_DIM), dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=object)
+        self._colids = np.empty(capacity, dtype=object)
+        self._positions = {}
+        self._size = 0
+        self._last_id = None
+        self._synced_at = None
+        self._indexed = False
+        self._loaded = False
+        self._search = BruteForceSearch()
+
+    def __len__(self):
+        return len(self._base_ids) + self._size
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.empty((capacity, ENCODING_DIM), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.empty(capacity, dtype=object)
+        ids[:self._size] = self._ids[:self._size]
+        colids = np.empty(capacity, dtype=object)
+        colids[:self._size] = self._colids[:self._size]
+        self._matrix, self._ids, self._colids = matrix, ids, colids
+
+    def _add_many(self, rows):
+        for user_id, encoding, colid in rows:
+            row = self._positions.get(user_id)
+            if row is None:
+                self._grow(self._size + 1)
+                row = self._size
+                self._ids[row] = user_id
+                self._positions[user_id] = row
+                self._size += 1
+            self._matrix[row] = encoding
+            self._colids[row] = partition_key(colid)
+            self._search.add(row, encoding)
+            if self._last_id is None or user_id > self._last_id:
+                self._last_id = user_id
+
+    def _fetch(self, query):
+        rows = []
+        for user in db.users.find(query, {"facedata": 1, "colid": 1}):
+            encoding = decode_facedata(user.get("facedata"))
+            if encoding is not None:
+                rows.append((user["_id"], encoding, user.get("colid")))
+        return rows
+
+    def _build_snapshot(self, rows):
+        """Writes the first snapshot if no other worker is already doing it."""
+        if not FACE_SNAPSHOT_DIR or not acquire_build_lock():
+            return None
+        try:
+            matrix = np.stack([enc for _, enc, _ in rows]) if rows else np.empty((0, ENCODING_DIM))
+            write_snapshot(matrix, [user_id for user_id, _, _ in rows], colids=[colid for _, _, colid in rows])
+            return load_snapshot()
+        except OSError as e:
+            print("Face index snapshot could not be written:", e)
+            return None
+        finally:
+            release_build_lock()
+
+    def load(self, sync=True):
+        """
+        Maps the latest snapshot and replays its delta log, falling back to a
+        full collection scan (and writing the first snapshot) if none exists.
+        With sync=False and a snapshot on disk, MongoDB is not queried.
+        """
+        started = datetime.utcnow()
+        self._snapshot_checked = time.monotonic()
+        snapshot = load_snapshot()
+        if snapshot is None:
+            rows = self._fetch({"facedata": {"$exists": True}})
+            snapshot = self._build_snapshot(rows)
+
+        if snapshot is not None:
+            base, base_ids, version, last_id = snapshot.matrix, snapshot.ids, snapshot.version, snapshot.last_id
+            partitions, ivf = snapshot.partitions, snapshot.ivf
+            tail = list(read_delta(snapshot.version))
+            if partitions is None:
+                print("Face index snapshot has no college partitions; colid-scoped logins look up "
+                      "college members in MongoDB until scripts/build_face_snapshot.py is run")
+        else:
+            # Keep rows grouped by college like a snapshot would
+            rows.sort(key=lambda row: partition_key(row[2]))
+            base = np.stack([enc for _, enc, _ in rows]) if rows else np.empty((0, ENCODING_DIM), dtype=np.float32)
+            base_ids = np.array([user_id for user_id, _, _ in rows], dtype=object)
+            version, last_id, tail = None, (max(base_ids) if len(base_ids) else None), []
+            partitions, ivf = {}, None
+            for row, (_, _, colid) in enumerate(rows):
+                start, _ = partitions.get(partition_key(colid), (row, row))
+                partitions[partition_key(colid)] = (start, row + 1)
+
+        with self._lock:
+            self._base, self._base_ids, self._version = base, base_ids, version
+            self._ivf = ivf
+            self._base_search = self._build_search(0, len(base))
+            self._partitions = partitions
+            self._partition_search = {}
+            self._matrix = np.empty((1024, ENCODING_DIM), dtype=np.float32)
+            self._ids = np.empty(1024, dtype=object)
+            self._colids = np.empty(1024, dtype=object)
+            self._positions = {}
+            self._size = 0
+            self._last_id = last_id
+            # A snapshot may be older than this load; sync from when it was written
+            if snapshot is not None:
+                self._synced_at = datetime.utcfromtimestamp(snapshot.created_at) if snapshot.created_at else None
+            else:
+                self._synced_at = started
+            self._search = BruteForceSearch()
+            self._add_many(tail)
+            self._loaded = True
+
+        # Registrations that reached MongoDB but not the delta log
+        if sync:
+            self.sync()
+        source = f"snapshot v{version}" if version else "database"
+        print(f"Face index loaded with {len(self)} encodings from {source} ({self._base_search.name} search)")
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    def _snapshot_changed(self):
+        """True at most every FACE_SNAPSHOT_CHECK_SECONDS if the manifest points at another version."""
+        now = time.monotonic()
+        if not FACE_SNAPSHOT_DIR or now - self._snapshot_checked < FACE_SNAPSHOT_CHECK_SECONDS:
+            return False
+        self._snapshot_checked = now
+        manifest = read_manifest()
+        return manifest is not None and manifest.get("version") != self._version
+
+    def sync(self):
+        """
+        Pulls users registered or re-enrolled since the last sync (e.g. by
+        another worker). Changes are found by `facedata_updated_at`, looking
+        back FACE_SYNC_OVERLAP_SECONDS, since ObjectIds from different
+        processes are not ordered. `_id` past the newest known id still
+        catches writers that do not stamp the field. A newer snapshot
+        (e.g. from scripts/build_face_snapshot.py) is loaded in full.
+        """
+        if not self._loaded:
+            return self.ensure_loaded()
+        if self._snapshot_changed():
+            return self.load()
+        started = datetime.utcnow()
+        changed = []
+        if self._synced_at is not None:
+            since = self._synced_at - timedelta(seconds=FACE_SYNC_OVERLAP_SECONDS)
+            changed.append({"facedata_updated_at": {"$gte": since}})
+        if self._last_id is not None:
+            changed.append({"_id": {"$gt": self._last_id}})
+        query = {"facedata": {"$exists": True}}
+        if changed:
+            query["$or"] = changed
+        if not self._indexed:
+            db.users.create_index("facedata_updated_at", sparse=True)
+            self._indexed = True
+        rows = self._fetch(query)
+        with self._lock:
+            if rows:
+                self._add_many(rows)
+            self._synced_at = started
+
+    def add(self, user_id, facedata, colid=None):
+        """Adds or replaces one user's encoding without rebuilding the index."""
+        encoding = decode_facedata(facedata)
+        if encoding is None:
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            self._add_many([(user_id, encoding, colid)])
+            version = self._version
+        try:
+            append_delta(version, user_id, encoding, colid)
+        except OSError as e:
+            print("Face index delta could not be written:", e)
+
+    def _build_search(self, start, end):
+        """
+        Search over base rows [start, end). Reuses the IVF clustering stored
+        with the snapshot when there is one instead of running k-means.
+        """
+        if self._ivf is not None and wants_ivf(end - start):
+            centroids, assignment, centroid_dist = self._ivf
+            return IVFSearch.from_assignment(centroids, assignment[start:end], centroid_dist[start:end])
+        return build_search(self._base[start:end])
+
+    def _partition(self, key):
+        """Search, matrix slice and ids of one college's rows in the base matrix."""
+        if self._partitions is None:
+            return self._unpartitioned(key)
+        start, end = self._partitions.get(key, (0, 0))
+        matrix = self._base[start:end]
+        search = self._partition_search.get(key)
+        if search is None:
+            search = self._partition_search[key] = self._build_search(start, end)
+        return search, matrix, self._base_ids[start:end]
+
+    def _unpartitioned(self, key):
+        """
+        A college's rows of a snapshot written before colid partitioning,
+        found by asking MongoDB who belongs to it, so the nearest face is
+        taken among that college only.
+        """
+        found = self._partition_search.get(key)
+        if found is None:
+            colids = [key, int(key)] if key.isdigit() else [key]
+            members = [user["_id"] for user in db.users.find({"colid": {"$in": colids}}, {"_id": 1})]
+            rows = np.flatnonzero(np.isin(self._base_ids, np.array(members, dtype=object)))
+            matrix = self._base[rows]
+            found = self._partition_search[key] = (build_search(matrix), matrix, self._base_ids[rows])
+        return found
+
+    def match(self, encoding, tolerance=FACE_LOGIN_TOLERANCE, colid=None):
+        """
+        Returns (user_id, distance) of the closest enrolled face within
+        `tolerance`, or (None, None) if nobody is close enough. With `colid`,
+        only that college's faces are searched.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            if colid is None:
+                parts = (
+                    (self._base_search, self._base, self._base_ids),
+                    (self._search, self._matrix[:self._size], self._ids[:self._size]),
+                )
+            else:
+                key = partition_key(colid)
+                tail = np.flatnonzero(self._colids[:self._size] == key)
+                parts = (
+                    self._partition(key),
+                    (BruteForceSearch(), self._matrix[tail], self._ids[tail]),
+                )
+
+            superseded = len(self._positions)
+
+        query = np.asarray(encoding, dtype=np.float32)
+        best_id, best_distance = None, None
+
+        for part, (search, matrix, ids) in enumerate(parts):
+            rows, distances = search.search(matrix, query, tolerance, k=1)
+            if part == 0 and len(rows) and ids[rows[0]] in self._positions:
+                # Base row of a user re-enrolled since the snapshot: take the
+                # closest base row that has not been superseded
+                rows, distances = search.search(matrix, query, tolerance, k=superseded + 1)
+                keep = np.array([ids[row] not in self._positions for row in rows], dtype=bool)
+                rows, distances = rows[keep], distances[keep]
+            if len(rows) and (best_distance is None or distances[0] < best_distance):
+                best_id, best_distance = ids[rows[0]], float(distances[0])
+
+        return best_id, best_distance
+
+    def nearest_many(self, encodings, colid=None, block=4096):
+        """
+        Closest enrolled user and distance for each of many encodings, found
+        with blocked matrix products over the index (or one college's
+        partition of it). Returns (ids, distances); ids are None and
+        distances inf where the index is empty.
+        """
+        self.ensure_loaded()
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        with self._lock:
+            if colid is None:
+                parts = [(self._base, self._base_ids), (self._matrix[:self._size], self._ids[:self._size])]
+            else:
+                key = partition_key(colid)
+                _, matrix, ids = self._partition(key)
+                tail = np.flatnonzero(self._colids[:self._size] == key)
+                parts = [(matrix, ids), (self._matrix[tail], self._ids[tail])]
+
+            superseded = list(self._positions)
+
+        best_ids = np.full(len(queries), None, dtype=object)
+        best_distances = np.full(len(queries), np.inf, dtype=np.float32)
+        rows = np.arange(len(queries))
+        for part, (matrix, ids) in enumerate(parts):
+            for start in range(0, len(matrix), block):
+                distances = pairwise_distances(queries, np.asarray(matrix[start:start + block]))
+                if part == 0 and superseded:
+                    distances[:, np.isin(ids[start:start + block], superseded)] = np.inf
+                nearest = distances.argmin(axis=1)
+                closer = distances[rows, nearest] < best_distances
+                best_distances[closer] = distances[rows, nearest][closer]
+                best_ids[closer] = ids[start + nearest[closer]]
+        return best_ids, best_distances
+
+
+def verify_face(encoding, users, tolerance=FACE_VERIFY_TOLERANCE):
+    """
+    1:1 verification against the few users an identity hint resolved to.
+    Returns (user, distance) for the closest one within `tolerance`, or
+    (None, None).
+    """
+    candidates = [(user, decode_facedata(user.get("facedata"))) for user in users]
+    candidates = [(user, enc) for user, enc in candidates if enc is not None]
+    if not candidates:
+        return None, None
+    matrix = np.stack([enc for _, enc in candidates])
+    distances = np.linalg.norm(matrix - np.asarray(encoding, dtype=np.float32), axis=1)
+    best = int(np.argmin(distances))
+    if distances[best] > tolerance:
+        return None, None
+    return candidates[best][0], float(distances[best])
+
+
+face_index = FaceIndex()
@@ -0,0 +1,87 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy comes with scikit-learn, but stay usable without it
+    linear_sum_assignment = None
+
+ATTENDANCE_TOLERANCE = 0.45
+
+
+def pairwise_distances(faces, known, known_sq=None):
+    """
+    Euclidean distances between every detected face and every known encoding,
+    as one (faces x known) matrix built from a single BLAS matrix product:
+    |a - b|^2 = |a|^2 + |b|^2 - 2 a.b
+    """
+    faces = np.asarray(faces, dtype=np.float32).reshape(-1, known.shape[1])
+    if known_sq is None:
+        known_sq = np.einsum("ij,ij->i", known, known)
+    faces_sq = np.einsum("ij,ij->i", faces, faces)
+    squared = faces_sq[:, None] + known_sq[None, :] - 2.0 * (faces @ known.T)
+    return np.sqrt(np.maximum(squared, 0.0, out=squared), out=squared)
+
+
+def assign_faces(distances, tolerance=ATTENDANCE_TOLERANCE, method="optimal"):
+    """
+    One-to-one assignment of faces (rows) to known students (columns) using
+    only pairs closer than `tolerance`. Returns a column index per face, or -1
+    for faces left unmatched.
+
+    "optimal" maximises the number of matched faces and then minimises the
+    total distance (Hungarian algorithm). "greedy" takes the closest remaining
+    pair first. It is used when scipy is unavailable.
+    """
+    faces, known = distances.shape
+    assignment = np.full(faces, -1, dtype=np.int64)
+    valid = distances < tolerance
+    if not valid.any():
+        return assignment
+
+    if method == "optimal" and linear_sum_assignment is not None:
+        # Only rows/columns with at least one candidate take part
+        rows = np.flatnonzero(valid.any(axis=1))
+        cols = np.flatnonzero(valid.any(axis=0))
+        sub = distances[np.ix_(rows, cols)]
+        # Any invalid pair costs more than every valid pair combined, so the
+        # solver never trades a match away for a lower total distance
+        penalty = tolerance * (min(len(rows), len(cols)) + 1)
+        cost = np.where(sub < tolerance, sub, penalty)
+        r, c = linear_sum_assignment(cost)
+        keep = sub[r, c] < tolerance
+        assignment[rows[r[keep]]] = cols[c[keep]]
+        return assignment
+
+    face_idx, known_idx = np.nonzero(valid)
+    order = np.argsort(distances[face_idx, known_idx], kind="stable")
+    used = np.zeros(known, dtype=bool)
+    for i in order:
+        f, k = face_idx[i], known_idx[i]
+        if assignment[f] == -1 and not used[k]:
+            assignment[f] = k
+            used[k] = True
+    return assignment
+
+
+def match_confidence(distance, tolerance=ATTENDANCE_TOLERANCE):
+    """Maps a match distance to 0..1: 1 for identical encodings, 0 at the tolerance."""
+    return round(max(0.0, 1.0 - float(distance) / tolerance), 4)
+
+
+def match_faces(face_encodings, known_encs, tolerance=ATTENDANCE_TOLERANCE, method="optimal"):
+    """
+    Matches every face found in one photo against a cohort matrix at once.
+    Returns (assignment, distances) where assignment[i] is the cohort row for
+    face i (or -1) and distances[i] its distance to that row (or to the
+    closest row when unmatched).
+    """
+    faces = len(face_encodings)
+    if faces == 0 or len(known_encs) == 0:
+        return np.full(faces, -1, dtype=np.int64), np.full(faces, np.inf, dtype=np.float32)
+
+    distances = pairwise_distances(face_encodings, known_encs)
+    assignment = assign_faces(distances, tolerance, method)
+    matched = assignment >= 0
+    best = distances.min(axis=1)
+    best[matched] = distances[np.flatnonzero(matched), assignment[matched]]
+    return assignment, best
@@ -0,0 +1,142 @@
+import os
+import threading
+import numpy as np
+from utils.face_profiles import HOG_MIN_FACE_PX
+
+# Set to 0 to send every login/registration photo straight to dlib
+FACE_PREFILTER = os.getenv("FACE_PREFILTER", "1") not in ("0", "false", "no")
+# Longest side the cascade runs at; it only has to find one large face
+FACE_PREFILTER_MAX_SIDE = int(os.getenv("FACE_PREFILTER_MAX_SIDE", 480))
+# Smallest face (in decoded-image pixels) worth encoding for login
+FACE_PREFILTER_MIN_FACE_PX = int(os.getenv("FACE_PREFILTER_MIN_FACE_PX", 60))
+# Variance of the Laplacian over the face, measured at a fixed 128 px width
+FACE_PREFILTER_BLUR_THRESHOLD = float(os.getenv("FACE_PREFILTER_BLUR_THRESHOLD", 40))
+
+# Faces at least this fraction of the largest one's width count as a second
+# person; smaller hits are background people or cascade noise
+COMPETING_FACE_RATIO = 0.5
+# Context kept around the cascade box so dlib's detector and 68-point
+# landmarks see the whole head
+CROP_MARGIN = 0.4
+BLUR_SAMPLE_WIDTH = 128
+
+REJECT_MESSAGES = {
+    "no_face": "No face found in image",
+    "multiple_faces": "More than one face found in image",
+    "face_too_small": "Face is too small, please move closer to the camera",
+    "blurry": "Image is too blurry, please hold the camera still",
+}
+
+_cascade = None
+
+
+class PrefilterRejected(ValueError):
+    def __init__(self, reason, message=None):
+        super().__init__(reason, message or REJECT_MESSAGES.get(reason, reason))
+        self.reason = reason
+        self.message = self.args[1]
+
+    def __str__(self):
+        return self.message
+
+
+def _get_cascade():
+    # Loaded once per face-compute worker
+    global _cascade
+    if _cascade is None:
+        import cv2
+        _cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        if _cascade.empty():
+            raise RuntimeError("OpenCV frontal face cascade not found")
+    return _cascade
+
+
+def find_portrait_face(img):
+    """
+    Runs the Haar cascade on a small grayscale copy of an RGB image and
+    returns the (x, y, w, h) box of the one face it should hold, in image
+    coordinates. Raises PrefilterRejected for no face, several faces, a face
+    too small to encode reliably or a blurry face.
+    """
+    import cv2
+
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    longest = max(gray.shape)
+    scale = min(FACE_PREFILTER_MAX_SIDE / longest, 1.0)
+    small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    min_px = max(int(FACE_PREFILTER_MIN_FACE_PX * scale), 24)
+    boxes = _get_cascade().detectMultiScale(small, scaleFactor=1.1, minNeighbors=5, minSize=(min_px, min_px))
+    if len(boxes) == 0:
+        raise PrefilterRejected("no_face")
+
+    boxes = sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
+    largest = boxes[0]
+    if any(b[2] >= largest[2] * COMPETING_FACE_RATIO for b in boxes[1:]):
+        raise PrefilterRejected("multiple_faces")
+
+    x, y, w, h = (int(round(v / scale)) for v in largest)
+    if w < FACE_PREFILTER_MIN_FACE_PX:
+        raise PrefilterRejected("face_too_small")
+
+    face = gray[y:y + h, x:x + w]
+    face = cv2.resize(face, (BLUR_SAMPLE_WIDTH, BLUR_SAMPLE_WIDTH), interpolation=cv2.INTER_AREA)
+    if cv2.Laplacian(face, cv2.CV_64F).var() < FACE_PREFILTER_BLUR_THRESHOLD:
+        raise PrefilterRejected("blurry")
+
+    return x, y, w, h
+
+
+def crop_to_face(img, box):
+    """Crops an RGB image to a face box plus margin; returns (crop, upsample hint)."""
+    x, y, w, h = box
+    pad_x, pad_y = int(w * CROP_MARGIN), int(h * CROP_MARGIN)
+    height, width = img.shape[:2]
+    top, bottom = max(y - pad_y, 0), min(y + h + pad_y, height)
+    left, right = max(x - pad_x, 0), min(x + w + pad_x, width)
+    crop = np.ascontiguousarray(img[top:bottom, left:right])
+    # HOG misses faces under ~80 px without one upsample
+    return crop, 1 if w < HOG_MIN_FACE_PX * 1.2 else 0
+
+
+class PrefilterStats:
+    """Counts how many portrait requests the pre-filter answered on its own."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.passed = 0
+        self.rejected = {reason: 0 for reason in REJECT_MESSAGES}
+        # Passed the cascade but dlib found no face in the crop
+        self.dlib_empty = 0
+        self._seconds = {"rejected": 0.0, "passed": 0.0}
+
+    def record(self, seconds, reason=None, found=True):
+        with self._lock:
+            self.checked += 1
+            if reason is not None:
+                self.rejected[reason] = self.rejected.get(reason, 0) + 1
+                self._seconds["rejected"] += seconds
+                return
+            self.passed += 1
+            self._seconds["passed"] += seconds
+            if not found:
+                self.dlib_empty += 1
+
+    def stats(self):
+        with self._lock:
+            rejected = sum(self.rejected.values())
+            return {
+                "enabled": FACE_PREFILTER,
+                "checked": self.checked,
+                "passed": self.passed,
+                "rejected": rejected,
+                "rejected_by_reason": dict(self.rejected),
+                "dlib_empty_after_pass": self.dlib_empty,
+                "short_circuit_rate": round(rejected / self.checked, 4) if self.checked else 0.0,
+                "avg_ms_rejected": round(1000 * self._seconds["rejected"] / rejected, 2) if rejected else None,
+                "avg_ms_passed": round(1000 * self._seconds["passed"] / self.passed, 2) if self.passed else None,
+            }
+
+
+prefilter_stats = PrefilterStats()
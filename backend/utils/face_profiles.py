@@ -0,0 +1,76 @@
+import os
+
+# Force one profile for every call site (e.g. "accurate" while debugging a
+# missed student); empty means pick per image
+FACE_PROFILE = os.getenv("FACE_PROFILE", "").lower()
+
+# HOG finds faces down to roughly 80 px, halved by each upsample
+HOG_MIN_FACE_PX = 80
+
+
+class FaceProfile:
+    """
+    Settings for one detect + encode pass.
+
+    detect_max_side: longest image side detection runs at; larger photos are
+        downscaled for detection only, encoding still uses full resolution
+    model: "hog" (CPU) or "cnn" (needs a CUDA dlib build to be practical)
+    upsample: times the detector upsamples the image to find small faces
+    num_jitters: re-samples averaged per encoding (cost grows linearly)
+    landmark_model: "small" (5-point) or "large" (68-point) alignment
+    """
+
+    def __init__(self, name, detect_max_side, model="hog", upsample=1, num_jitters=1, landmark_model="large"):
+        self.name = name
+        self.detect_max_side = detect_max_side
+        self.model = model
+        self.upsample = upsample
+        self.num_jitters = num_jitters
+        self.landmark_model = landmark_model
+
+    def detect_scale(self, shape):
+        """Factor to resize an image of `shape` by before detection (<= 1)."""
+        longest = max(shape[0], shape[1])
+        if not self.detect_max_side or longest <= self.detect_max_side:
+            return 1.0
+        return self.detect_max_side / longest
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+PROFILES = {
+    # Single face close to the camera: selfies for login and enrolment
+    "portrait": FaceProfile("portrait", 640, upsample=0),
+    # Small group or front rows
+    "fast": FaceProfile("fast", 1280, upsample=0, landmark_model="small"),
+    "balanced": FaceProfile("balanced", 1600, upsample=1),
+    # Full lecture hall; faces at the back are tiny
+    "accurate": FaceProfile("accurate", 2400, upsample=1),
+    "cnn": FaceProfile("cnn", 1600, model="cnn", upsample=1),
+}
+
+
+def select_profile(shape, expected_faces=1, purpose="attendance"):
+    """
+    Picks a profile from the image size and how many faces it should hold.
+
+    Login and registration photos hold one large face, so a 640 px detection
+    pass is enough. For classroom photos, more expected faces means smaller
+    faces, so detection runs at a higher resolution and upsamples once.
+    """
+    if FACE_PROFILE in PROFILES:
+        return PROFILES[FACE_PROFILE]
+
+    if purpose in ("login", "register"):
+        return PROFILES["portrait"]
+
+    expected_faces = expected_faces or 1
+    longest = max(shape[0], shape[1])
+
+    # Low-resolution photos need upsampling whatever the head count
+    if expected_faces <= 10 and longest > PROFILES["portrait"].detect_max_side:
+        return PROFILES["fast"]
+    if expected_faces <= 40:
+        return PROFILES["balanced"]
+    return PROFILES["accurate"]
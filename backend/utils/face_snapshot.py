@@ -0,0 +1,248 @@
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from bson import ObjectId
+from utils.app_dirs import APP_DATA_DIR, UnsafeDirectory, private_dir
+from utils.face_ann import IVFSearch, wants_ivf
+from utils.face_codec import ENCODING_DIM, FACEDATA_DTYPE
+
+# Shared by every worker on the host; empty disables snapshots. Snapshot rows
+# decide who a face login resolves to, so the directory must be private to
+# the app's user (see utils/app_dirs.py) or snapshots are not used
+FACE_SNAPSHOT_DIR = os.getenv("FACE_SNAPSHOT_DIR", os.path.join(APP_DATA_DIR, "face_index"))
+
+MANIFEST = "manifest.json"
+BUILD_LOCK = "build.lock"
+# A build lock older than this is assumed to belong to a crashed worker
+BUILD_LOCK_STALE_SECONDS = 600
+
+
+class Snapshot:
+    """
+    A read-only, memory-mapped face matrix plus its id table. Rows are
+    grouped by college; `partitions` maps partition_key(colid) to the
+    [start, end) row range of that college, or is None for snapshots
+    written before partitioning. `ivf` is (centroids, assignment,
+    centroid_dist) of the IVF index built with the snapshot, or None.
+    """
+
+    def __init__(self, version, matrix, ids, last_id, partitions=None, created_at=None, ivf=None):
+        self.version = version
+        self.matrix = matrix
+        self.ids = ids
+        self.last_id = last_id
+        self.partitions = partitions
+        self.created_at = created_at
+        self.ivf = ivf
+
+
+def partition_key(colid):
+    """Normalises a colid (int in the users collection, str in forms) to one key."""
+    if colid is None:
+        return ""
+    colid = str(colid).strip()
+    return str(int(colid)) if colid.isdigit() else colid
+
+
+def _path(directory, name):
+    return os.path.join(directory, name)
+
+
+def _parse_id(value):
+    return ObjectId(value) if ObjectId.is_valid(value) else value
+
+
+def _trusted(directory):
+    """Whether snapshot files in `directory` can be trusted (see private_dir)."""
+    try:
+        private_dir(directory)
+        return True
+    except UnsafeDirectory as e:
+        print("Face index snapshots disabled:", e)
+        return False
+    except OSError:
+        return False
+
+
+def _read_ids(path, count):
+    """Ids of a snapshot: packed 12-byte ObjectIds (.bin) or a JSON list."""
+    if path.endswith(".bin"):
+        with open(path, "rb") as f:
+            raw = f.read()
+        if len(raw) != count * 12:
+            raise ValueError(f"{path} holds {len(raw)} bytes for {count} ids")
+        return np.array([ObjectId(raw[i:i + 12]) for i in range(0, len(raw), 12)], dtype=object)
+    with open(path) as f:
+        return np.array([_parse_id(i) for i in json.load(f)], dtype=object)
+
+
+def _write_atomic(path, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_manifest(directory=FACE_SNAPSHOT_DIR):
+    try:
+        with open(_path(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_snapshot(directory=FACE_SNAPSHOT_DIR):
+    """
+    Opens the current snapshot with np.memmap, so every worker process shares
+    the same pages through the OS cache. Returns None if there is none.
+    """
+    if not directory or not _trusted(directory):
+        return None
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+
+    count = manifest["count"]
+    if count:
+        matrix = np.memmap(_path(directory, manifest["matrix"]), dtype=FACEDATA_DTYPE,
+                           mode="r", shape=(count, ENCODING_DIM))
+    else:
+        matrix = np.empty((0, ENCODING_DIM), dtype=FACEDATA_DTYPE)
+
+    ids = _read_ids(_path(directory, manifest["ids"]), count)
+
+    ivf = None
+    if manifest.get("ivf"):
+        with np.load(_path(directory, manifest["ivf"]), allow_pickle=False) as parts:
+            ivf = (parts["centroids"], parts["assignment"], parts["centroid_dist"])
+
+    last_id = _parse_id(manifest["last_id"]) if manifest.get("last_id") else None
+    partitions = manifest.get("partitions")
+    if partitions is not None:
+        partitions = {key: tuple(bounds) for key, bounds in partitions.items()}
+    return Snapshot(manifest["version"], matrix, ids, last_id, partitions, manifest.get("created_at"), ivf)
+
+
+def write_snapshot(matrix, ids, directory=FACE_SNAPSHOT_DIR, colids=None):
+    """
+    Writes a new snapshot version and points the manifest at it. With
+    `colids`, rows are sorted by college so each college is one contiguous
+    slice of the mapped matrix. Large snapshots also store their IVF
+    centroids and row assignments, so workers load the index without
+    re-clustering. Files of older versions are removed; workers that still
+    map them keep their pages until they reopen.
+    """
+    private_dir(directory)
+    manifest = read_manifest(directory) or {"version": 0}
+    version = manifest["version"] + 1
+
+    matrix = np.ascontiguousarray(matrix, dtype=FACEDATA_DTYPE)
+    partitions = None
+    if colids is not None:
+        keys = [partition_key(c) for c in colids]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        matrix = matrix[order] if len(order) else matrix
+        ids = [ids[i] for i in order]
+        partitions = {}
+        for row, i in enumerate(order):
+            start, _ = partitions.get(keys[i], (row, row))
+            partitions[keys[i]] = (start, row + 1)
+    matrix_name = f"matrix-v{version}.f32"
+    _write_atomic(_path(directory, matrix_name), lambda f: f.write(matrix.tobytes()))
+
+    if all(isinstance(i, ObjectId) for i in ids):
+        ids_name = f"ids-v{version}.bin"
+        _write_atomic(_path(directory, ids_name), lambda f: f.write(b"".join(i.binary for i in ids)))
+    else:
+        ids_name = f"ids-v{version}.json"
+        _write_atomic(_path(directory, ids_name), lambda f: f.write(json.dumps([str(i) for i in ids]).encode()))
+
+    ivf_name = None
+    if wants_ivf(len(ids)):
+        search = IVFSearch(matrix)
+        ivf_name = f"ivf-v{version}.npz"
+        _write_atomic(_path(directory, ivf_name), lambda f: np.savez(
+            f, centroids=search.centroids, assignment=search.assignment.astype(np.int32),
+            centroid_dist=search.centroid_dist))
+
+    new_manifest = {
+        "version": version,
+        "count": len(ids),
+        "dim": ENCODING_DIM,
+        "matrix": matrix_name,
+        "ids": ids_name,
+        "ivf": ivf_name,
+        "last_id": str(max(ids)) if len(ids) else None,
+        "partitions": partitions,
+        "created_at": time.time(),
+    }
+    _write_atomic(_path(directory, MANIFEST), lambda f: f.write(json.dumps(new_manifest).encode()))
+
+    for name in os.listdir(directory):
+        stem = name.rsplit(".", 1)[0]
+        if stem.rsplit("-v", 1)[-1].isdigit() and int(stem.rsplit("-v", 1)[-1]) < version:
+            os.unlink(_path(directory, name))
+    return version
+
+
+def acquire_build_lock(directory=FACE_SNAPSHOT_DIR):
+    """Lets one worker build the first snapshot while the others skip it."""
+    if not _trusted(directory):
+        return False
+    path = _path(directory, BUILD_LOCK)
+    try:
+        if time.time() - os.path.getmtime(path) > BUILD_LOCK_STALE_SECONDS:
+            os.unlink(path)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+def release_build_lock(directory=FACE_SNAPSHOT_DIR):
+    try:
+        os.unlink(_path(directory, BUILD_LOCK))
+    except OSError:
+        pass
+
+
+def append_delta(version, user_id, encoding, colid=None, directory=FACE_SNAPSHOT_DIR):
+    """Records a registration made after snapshot `version` was taken."""
+    if not directory or version is None:
+        return
+    line = json.dumps({
+        "id": str(user_id),
+        "enc": np.asarray(encoding, dtype=FACEDATA_DTYPE).tobytes().hex(),
+        "colid": partition_key(colid),
+    })
+    # One short O_APPEND write per line keeps concurrent workers from interleaving
+    with open(_path(directory, f"delta-v{version}.log"), "a") as f:
+        f.write(line + "\n")
+
+
+def read_delta(version, directory=FACE_SNAPSHOT_DIR):
+    """Yields (user_id, encoding, colid key) for registrations since snapshot `version`."""
+    if not _trusted(directory):
+        return
+    try:
+        with open(_path(directory, f"delta-v{version}.log")) as f:
+            lines = f.readlines()
+    except OSError:
+        return
+    for line in lines:
+        try:
+            entry = json.loads(line)
+            encoding = np.frombuffer(bytes.fromhex(entry["enc"]), dtype=FACEDATA_DTYPE)
+        except (ValueError, KeyError):
+            continue  # a torn final line from a crashed writer
+        if encoding.shape == (ENCODING_DIM,):
+            yield _parse_id(entry["id"]), encoding, entry.get("colid", "")
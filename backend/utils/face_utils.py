@@ -1,18 +1,27 @@
-import json
 import numpy as np
-import face_recognition
-from extensions import mongo
-from io import BytesIO
 from pymongo import MongoClient
 import os
+from utils.face_cache import cohort_cache, cohort_key
+from utils.face_codec import ENCODING_DIM, decode_facedata
+from utils.face_match import match_confidence, match_faces
+from utils.face_compute import FaceComputeError, detect_and_encode_image, detect_and_encode_many, encode_video_tracks
+from utils.image_ingest import InvalidImage
 
 client = MongoClient(os.getenv("MONGO_URI"))
 db = client[os.getenv("DB_NAME")]
 
+# Tracks of one person from a video sit much closer than the match threshold
+VIDEO_TRACK_MERGE_TOLERANCE = 0.35
+
 
 
 
 def load_known_faces_from_db(colid, program_code, year):
+    key = cohort_key(colid, program_code, year)
+    cached = cohort_cache.get(key)
+    if cached is not None:
+        return cached
+
     print(f"Searching for students with colid: {colid}, program_code: {program_code}, year: {year}")
 
     query = {
@@ -28,43 +37,138 @@ def load_known_faces_from_db(colid, program_code, year):
 
     students = db.users.find(query, {"name": 1, "facedata": 1})
 
-    known_data = [
-        (np.array(s["facedata"]), s["name"])
-        for s in students
-        if "facedata" in s and isinstance(s["facedata"], list)
-    ]
-
-    known_encs, known_names = zip(*known_data) if known_data else ([], [])
-
-    return list(known_encs), list(known_names)
-
-def recognize_faces_from_bytes(image_bytes, known_encs, known_names):
+    known_data = []
+    for s in students:
+        encoding = decode_facedata(s.get("facedata"))
+        if encoding is not None:
+            known_data.append((encoding, s["name"], s["_id"]))
+
+    if known_data:
+        encs, names, ids = zip(*known_data)
+        known_encs = np.stack(encs)
+        known_names = list(names)
+        known_ids = list(ids)
+    else:
+        known_encs = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        known_names = []
+        known_ids = []
+
+    cohort_cache.put(key, known_encs, known_names, known_ids)
+    return known_encs, known_names, known_ids
+
+def match_face_encodings(face_encodings, known_encs, known_names):
+    """
+    Matches all faces of one photo against the cohort in a single distance
+    matrix with one-to-one assignment, so two faces never claim the same
+    student. Returns the matched cohort rows, the unmatched encodings and a
+    per-face result with its confidence.
+    """
+    assignment, distances = match_faces(face_encodings, known_encs)
+
+    recognized = set()
+    unknown_encodings = []
+    faces = []
+
+    for face_enc, row, distance in zip(face_encodings, assignment, distances):
+        if row >= 0:
+            recognized.add(int(row))
+            faces.append({
+                "name": known_names[row],
+                "distance": round(float(distance), 4),
+                "confidence": match_confidence(distance),
+            })
+        else:
+            unknown_encodings.append(face_enc)
+            faces.append({
+                "name": None,
+                "distance": round(float(distance), 4) if np.isfinite(distance) else None,
+                "confidence": 0.0,
+            })
+
+    return recognized, unknown_encodings, faces
+
+def count_distinct_faces(encodings, tolerance=0.45):
+    """Counts people among unmatched faces, merging the same face seen in several photos."""
+    distinct = []
+    for enc in encodings:
+        if not distinct or np.min(np.linalg.norm(np.asarray(distinct) - enc, axis=1)) >= tolerance:
+            distinct.append(enc)
+    return len(distinct)
+
+def recognize_faces_from_bytes(image, known_encs, known_names, known_ids):
+    """
+    `image` is the upload's bytes or spooled file path. Returns (present
+    names, unknown count, total faces, present student ids, per-face
+    matches); ids come straight from the cohort so callers need no
+    name lookups. Raises InvalidImage if the upload cannot be decoded.
+    """
     try:
        
-        img = face_recognition.load_image_file(BytesIO(image_bytes))
-
-        
-        face_locations = face_recognition.face_locations(img)
-        face_encodings = face_recognition.face_encodings(img, face_locations)
-
-        recognized_names = set()
-        unknown_count = 0
-
-        for face_enc in face_encodings:
-            if not known_encs:
-                unknown_count += 1
-                continue
-
-            distances = face_recognition.face_distance(known_encs, face_enc)
-            best_match_index = np.argmin(distances)
+        face_encodings = detect_and_encode_image(image, expected_faces=len(known_names))
 
-            if distances[best_match_index] < 0.45:  
-                recognized_names.add(known_names[best_match_index])
-            else:
-                unknown_count += 1
+        recognized, unknown_encodings, faces = match_face_encodings(face_encodings, known_encs, known_names)
 
-        return list(recognized_names), unknown_count, len(face_encodings)
+        rows = sorted(recognized)
+        return ([known_names[i] for i in rows], len(unknown_encodings), len(face_encodings),
+                [known_ids[i] for i in rows], faces)
 
+    except (FaceComputeError, InvalidImage):
+        raise
     except Exception as e:
         print("Recognition failed:", e)
-        return [], 0, 0
+        return [], 0, 0, [], []
+
+def merge_track_encodings(encodings, tolerance=VIDEO_TRACK_MERGE_TOLERANCE):
+    """
+    Merges tracks that are the same person (e.g. someone who left the frame
+    and came back) so they do not compete for one student in the 1:1 match.
+    """
+    groups = []
+    for enc in encodings:
+        for group in groups:
+            if np.linalg.norm(np.mean(group, axis=0) - enc) < tolerance:
+                group.append(enc)
+                break
+        else:
+            groups.append([enc])
+    return [np.mean(group, axis=0) for group in groups]
+
+def recognize_faces_from_video(video_path, known_encs, known_names, known_ids):
+    """
+    Recognizes students in a classroom clip. Faces are tracked across sampled
+    frames and encoded once or a few times per track, then matched against
+    the cohort exactly like the faces of a single photo.
+    """
+    track_encodings = encode_video_tracks(video_path, expected_faces=len(known_names))
+    people = merge_track_encodings(track_encodings)
+
+    recognized, unknown_encodings, faces = match_face_encodings(people, known_encs, known_names)
+
+    rows = sorted(recognized)
+    return ([known_names[i] for i in rows], len(unknown_encodings), len(people),
+            [known_ids[i] for i in rows], faces)
+
+def recognize_faces_from_batch(images, known_encs, known_names, known_ids):
+    """
+    Recognizes faces across several photos of one class session. Images are
+    encoded in parallel on the face-compute pool, every face is matched
+    against the same cohort matrix, and students seen in more than one photo
+    are counted once.
+    """
+    recognized = set()
+    unknown_encodings = []
+    faces = []
+
+    for image_encodings in detect_and_encode_many(images, expected_faces=len(known_names)):
+        if isinstance(image_encodings, Exception):
+            print("Recognition failed:", image_encodings)
+            continue
+        rows, unknown, image_faces = match_face_encodings(image_encodings, known_encs, known_names)
+        recognized |= rows
+        unknown_encodings.extend(unknown)
+        faces.append(image_faces)
+
+    unknown_count = count_distinct_faces(unknown_encodings)
+    rows = sorted(recognized)
+    return ([known_names[i] for i in rows], unknown_count, len(rows) + unknown_count,
+            [known_ids[i] for i in rows], faces)
@@ -0,0 +1,74 @@
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# OpenAI calls in flight across every request in this process
+AI_GRADING_MAX_CONCURRENCY = int(os.getenv("AI_GRADING_MAX_CONCURRENCY", 16))
+# Calls one submission may have in flight, so a long assignment cannot take
+# the whole pool from everyone else submitting at the same time
+AI_GRADING_PER_REQUEST = int(os.getenv("AI_GRADING_PER_REQUEST", 4))
+# Upper bound on grading one submission; answers still pending are left ungraded
+AI_GRADING_TIMEOUT = float(os.getenv("AI_GRADING_TIMEOUT", 60))
+
+logger = logging.getLogger(__name__)
+
+
+class GradingPool:
+    """
+    Shared thread pool for blocking LLM grading calls. The pool size is the
+    global concurrency limit; map() adds a per-request window on top.
+    """
+
+    def __init__(self, max_concurrency=AI_GRADING_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="ai-grading")
+
+    def map(self, fn, items, per_request=AI_GRADING_PER_REQUEST, timeout=AI_GRADING_TIMEOUT):
+        """
+        Calls fn(*item) for every item, at most `per_request` at a time.
+        Returns the results in the order of `items`, whatever order the calls
+        finish in; an item whose call raised or did not finish within
+        `timeout` (None for no limit) gets None.
+        """
+        items = list(items)
+        results = [None] * len(items)
+        if len(items) == 1:
+            # Nothing to overlap; skip the thread hop
+            try:
+                results[0] = fn(*items[0])
+            except Exception as e:
+                logger.error(f"Grading call failed: {e}", exc_info=True)
+            return results
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        queued = iter(enumerate(items))
+        running = {}
+
+        def submit_next():
+            for index, item in queued:
+                running[self._executor.submit(fn, *item)] = index
+                return
+
+        for _ in range(min(per_request, len(items))):
+            submit_next()
+
+        while running:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                logger.warning(f"Grading timed out with {len(running)} call(s) still running")
+                for future in running:
+                    future.cancel()
+                break
+            done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logger.error(f"Grading call failed: {e}", exc_info=True)
+                submit_next()
+        return results
+
+
+grading_pool = GradingPool()
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from pymongo import MongoClient
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from utils.verdict_cache import critical_tokens
+
+client = MongoClient(os.getenv("MONGO_URI"))
+db = client[os.getenv("DB_NAME")]
+
+grading_config = db["grading_config"]
+
+GRADING_PRESCREEN = os.getenv("GRADING_PRESCREEN", "true").lower() in ("1", "true", "yes")
+# Bands to use before scripts/calibrate_grading_bands.py --write has stored
+# calibrated ones. Unset by default: until then every answer goes to the LLM
+SIMILARITY_ACCEPT_ABOVE = float(os.getenv("SIMILARITY_ACCEPT_ABOVE")) if os.getenv("SIMILARITY_ACCEPT_ABOVE") else None
+SIMILARITY_REJECT_BELOW = float(os.getenv("SIMILARITY_REJECT_BELOW", 0.0))
+# How often workers re-read the calibrated bands
+GRADING_BANDS_REFRESH_SECONDS = int(os.getenv("GRADING_BANDS_REFRESH_SECONDS", 300))
+
+BANDS_ID = "similarity_bands"
+
+logger = logging.getLogger(__name__)
+
+
+def answer_similarity(reference, answer):
+    """TF-IDF cosine similarity of an answer to the reference, 0..1 (same scorer as /evaluate-descriptive)."""
+    if not (reference or "").strip() or not (answer or "").strip():
+        return 0.0
+    try:
+        vecs = TfidfVectorizer().fit_transform([reference, answer])
+    except ValueError:
+        # No word tokens in either text
+        return 0.0
+    return float(cosine_similarity(vecs[0:1], vecs[1:2])[0][0])
+
+
+class SimilarityPrescreen:
+    """
+    First grading tier: answers whose similarity to the reference is at or
+    above `accept_above` are marked correct, those below `reject_below`
+    incorrect, and only the band in between is left for the LLM. An answer
+    whose negation or numbers differ from the reference's (see
+    critical_tokens) is never accepted on similarity. Without calibrated
+    (or configured) bands nothing is screened.
+    """
+
+    def __init__(self, enabled=GRADING_PRESCREEN):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._bands = None
+        self._loaded_at = 0.0
+        self.outcomes = Counter()
+
+    def bands(self):
+        """
+        (reject_below, accept_above): the calibrated pair from grading_config,
+        else the env-configured one, else None (pre-screen off).
+        """
+        with self._lock:
+            if not self._loaded_at or time.monotonic() - self._loaded_at > GRADING_BANDS_REFRESH_SECONDS:
+                bands = None
+                if SIMILARITY_ACCEPT_ABOVE is not None:
+                    bands = (SIMILARITY_REJECT_BELOW, SIMILARITY_ACCEPT_ABOVE)
+                try:
+                    doc = grading_config.find_one({"_id": BANDS_ID})
+                    if doc:
+                        bands = (doc["reject_below"], doc["accept_above"])
+                except Exception as e:
+                    logger.error(f"Loading similarity bands failed: {e}")
+                    bands = self._bands if self._loaded_at else bands
+                self._bands, self._loaded_at = bands, time.monotonic()
+            return self._bands
+
+    def screen(self, triples):
+        """Verdicts for (question, answer, reference) triples: True/False where clear-cut, None for the LLM."""
+        bands = self.bands() if self.enabled else None
+        if bands is None:
+            return [None] * len(triples)
+        reject_below, accept_above = bands
+        verdicts, guarded = [], 0
+        for _, answer, reference in triples:
+            similarity = answer_similarity(reference, answer)
+            if similarity >= accept_above:
+                if critical_tokens(answer) == critical_tokens(reference):
+                    verdicts.append(True)
+                else:
+                    verdicts.append(None)
+                    guarded += 1
+            elif similarity < reject_below:
+                verdicts.append(False)
+            else:
+                verdicts.append(None)
+        with self._lock:
+            self.outcomes["accepted"] += verdicts.count(True)
+            self.outcomes["rejected"] += verdicts.count(False)
+            self.outcomes["ambiguous"] += verdicts.count(None)
+            self.outcomes["guarded"] += guarded
+        return verdicts
+
+    def stats(self):
+        bands = self.bands()
+        reject_below, accept_above = bands or (None, None)
+        with self._lock:
+            screened = self.outcomes["accepted"] + self.outcomes["rejected"] + self.outcomes["ambiguous"]
+            return {
+                "enabled": self.enabled,
+                "calibrated": bands is not None,
+                "reject_below": reject_below,
+                "accept_above": accept_above,
+                "screened": screened,
+                "accepted": self.outcomes["accepted"],
+                "rejected": self.outcomes["rejected"],
+                "sent_to_llm": self.outcomes["ambiguous"],
+                "held_back_for_negation_or_numbers": self.outcomes["guarded"],
+                "llm_rate": round(self.outcomes["ambiguous"] / screened, 4) if screened else 0.0,
+            }
+
+
+prescreen = SimilarityPrescreen()
@@ -0,0 +1,189 @@
+import logging
+import os
+import socket
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from pymongo import MongoClient, ReturnDocument
+
+client = MongoClient(os.getenv("MONGO_URI"))
+db = client[os.getenv("DB_NAME")]
+
+grading_jobs = db["grading_jobs"]
+
+# Worker threads each web process runs; 0 leaves the queue to
+# `python -m scripts.grading_worker` processes
+GRADING_WORKERS = int(os.getenv("GRADING_WORKERS", 2))
+# A running job whose worker has not finished it by then is handed to another
+GRADING_JOB_LEASE_SECONDS = int(os.getenv("GRADING_JOB_LEASE_SECONDS", 300))
+GRADING_JOB_MAX_ATTEMPTS = int(os.getenv("GRADING_JOB_MAX_ATTEMPTS", 3))
+# How often idle workers look for jobs queued by other processes
+GRADING_POLL_SECONDS = float(os.getenv("GRADING_POLL_SECONDS", 2))
+
+RETRY_BACKOFF_SECONDS = 30
+RETRY_BACKOFF_MAX_SECONDS = 600
+
+logger = logging.getLogger(__name__)
+
+
+class JobFailed(Exception):
+    """Raised by a handler for a job that cannot succeed on retry; it is failed at once."""
+
+
+class GradingQueue:
+    """
+    Durable queue of grading jobs in the `grading_jobs` collection. Workers
+    claim a job with a lease; a job whose worker died is claimed again when
+    the lease runs out, and a job whose handler raised is retried with
+    backoff until GRADING_JOB_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, collection=grading_jobs, lease_seconds=GRADING_JOB_LEASE_SECONDS,
+                 max_attempts=GRADING_JOB_MAX_ATTEMPTS, poll_seconds=GRADING_POLL_SECONDS):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._indexes_ready = False
+        self.outcomes = Counter()
+
+    def _ensure_indexes(self):
+        if not self._indexes_ready:
+            self.collection.create_index([("status", 1), ("available_at", 1)])
+            self._indexes_ready = True
+
+    def enqueue(self, job_id, **fields):
+        """Queues a job under `job_id` (one job per submission) and wakes a local worker."""
+        self._ensure_indexes()
+        now = datetime.utcnow()
+        self.collection.insert_one({
+            "_id": job_id,
+            "status": "queued",
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now,
+            **fields
+        })
+        self._wake.set()
+        return job_id
+
+    def claim(self):
+        """
+        Takes the oldest runnable job, or a running one whose lease expired
+        with attempts left; None if there is none. Expired jobs on their
+        last attempt are failed instead of being run again.
+        """
+        now = datetime.utcnow()
+        self.collection.update_many(
+            {"status": "running", "lease_until": {"$lte": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": "failed", "error": "Lease expired on the last attempt", "finished_at": now},
+             "$unset": {"lease_until": ""}}
+        )
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lte": now}, "attempts": {"$lt": self.max_attempts}}
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    # Thread too: a lease can expire and be reclaimed within one process
+                    "worker": f"{self.worker_id}:{threading.get_ident()}",
+                    "started_at": now,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds)
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def is_last_attempt(self, job):
+        return job.get("attempts", 0) >= self.max_attempts
+
+    def _owned(self, job):
+        """Filter matching `job` only while it is still this claim's: same worker and attempt, still running."""
+        return {"_id": job["_id"], "status": "running", "worker": job.get("worker"), "attempts": job.get("attempts")}
+
+    def _finish(self, job, result):
+        updated = self.collection.update_one(self._owned(job), {
+            "$set": {"status": "done", "result": result, "finished_at": datetime.utcnow()},
+            "$unset": {"lease_until": "", "error": ""}
+        })
+        self.outcomes["done" if updated.matched_count else "lease_lost"] += 1
+
+    def _retry_or_fail(self, job, error):
+        now = datetime.utcnow()
+        if isinstance(error, JobFailed) or self.is_last_attempt(job):
+            update = {"status": "failed", "error": str(error), "finished_at": now}
+        else:
+            delay = min(RETRY_BACKOFF_SECONDS * 2 ** (job.get("attempts", 1) - 1), RETRY_BACKOFF_MAX_SECONDS)
+            update = {"status": "queued", "error": str(error), "available_at": now + timedelta(seconds=delay)}
+        updated = self.collection.update_one(self._owned(job), {"$set": update, "$unset": {"lease_until": ""}})
+        # Unmatched: another worker reclaimed the job after our lease ran out and owns the outcome
+        outcome = "failed" if update["status"] == "failed" else "retried"
+        self.outcomes[outcome if updated.matched_count else "lease_lost"] += 1
+
+    def run_once(self, handler):
+        """Claims and runs one job with handler(job, last_attempt). Returns False when the queue was empty."""
+        job = self.claim()
+        if job is None:
+            return False
+        try:
+            result = handler(job, self.is_last_attempt(job))
+        except Exception as e:
+            logger.error(f"Grading job {job['_id']} failed on attempt {job.get('attempts')}: {e}", exc_info=True)
+            self._retry_or_fail(job, e)
+        else:
+            self._finish(job, result)
+        return True
+
+    def work(self, handler):
+        while not self._stop.is_set():
+            try:
+                if self.run_once(handler):
+                    continue
+            except Exception as e:
+                # Mongo unreachable and the like; keep the worker alive
+                logger.error(f"Grading worker error: {e}", exc_info=True)
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def start(self, handler, workers=GRADING_WORKERS):
+        """Starts `workers` daemon threads draining the queue; later calls are no-ops."""
+        with self._lock:
+            if self._threads or workers <= 0:
+                return
+            for i in range(workers):
+                thread = threading.Thread(target=self.work, args=(handler,), name=f"grading-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started {workers} grading worker(s)")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self):
+        counts = {doc["_id"]: doc["count"] for doc in self.collection.aggregate([
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ])}
+        oldest = self.collection.find_one({"status": "queued"}, {"created_at": 1}, sort=[("created_at", 1)])
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_queued_seconds": round((datetime.utcnow() - oldest["created_at"]).total_seconds(), 1)
+            if oldest else 0,
+            "local_workers": len(self._threads),
+            "local_outcomes": dict(self.outcomes),
+        }
+
+
+grading_queue = GradingQueue()
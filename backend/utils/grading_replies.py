@@ -0,0 +1,18 @@
+def parse_batch_verdicts(data, count):
+    """
+    Reads a batched grading reply, {"verdicts": [{"item": n, "grade":
+    "Correct" | "Incorrect"}, ...]} with 1-based item numbers, into one
+    True/False per item. Items missing, repeated, out of range or with any
+    other grade are None.
+    """
+    verdicts = [None] * count
+    entries = data.get("verdicts") if isinstance(data, dict) else None
+    for entry in entries if isinstance(entries, list) else []:
+        try:
+            index = int(entry["item"]) - 1
+            grade = str(entry["grade"]).strip().lower()
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= index < count and verdicts[index] is None and grade in ("correct", "incorrect"):
+            verdicts[index] = grade == "correct"
+    return verdicts
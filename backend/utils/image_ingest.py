@@ -0,0 +1,144 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+import numpy as np
+
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 20 * 1024 * 1024))
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", 200 * 1024 * 1024))
+# Uploads larger than this are spooled to a temp file and handed to the
+# face-compute workers by path instead of being pickled across processes
+IMAGE_SPOOL_BYTES = int(os.getenv("IMAGE_SPOOL_BYTES", 1024 * 1024))
+
+CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class IngestedUpload:
+    """
+    One uploaded file, read exactly once: size-checked and SHA-256 hashed
+    while streaming, kept in memory when small and spooled to a temp file
+    when large. `source` is what the face-compute workers decode from.
+    """
+
+    def __init__(self, data=None, path=None, key=None, size=0, content_type=None):
+        self.data = data
+        self.path = path
+        self.key = key
+        self.size = size
+        self.content_type = content_type
+
+    @classmethod
+    def from_stream(cls, stream, max_bytes=IMAGE_MAX_BYTES, content_type=None, suffix="",
+                    spool_bytes=IMAGE_SPOOL_BYTES):
+        digest = hashlib.sha256()
+        buffer = BytesIO()
+        spool = None
+        size = 0
+        try:
+            for chunk in iter(lambda: stream.read(CHUNK_BYTES), b""):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the limit of {max_bytes} bytes")
+                digest.update(chunk)
+                if spool is None and size > spool_bytes:
+                    spool = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+                    spool.write(buffer.getbuffer())
+                    buffer = None
+                (spool if spool is not None else buffer).write(chunk)
+        except BaseException:
+            if spool is not None:
+                spool.close()
+                os.unlink(spool.name)
+            raise
+
+        if spool is not None:
+            spool.close()
+            return cls(path=spool.name, key=digest.hexdigest(), size=size, content_type=content_type)
+        return cls(data=buffer.getvalue(), key=digest.hexdigest(), size=size, content_type=content_type)
+
+    @classmethod
+    def from_upload(cls, file, max_bytes=IMAGE_MAX_BYTES, spool_bytes=IMAGE_SPOOL_BYTES):
+        suffix = os.path.splitext(file.filename or "")[1]
+        return cls.from_stream(file.stream, max_bytes, file.mimetype, suffix, spool_bytes)
+
+    @property
+    def source(self):
+        return self.path if self.path is not None else self.data
+
+    def open(self):
+        return open(self.path, "rb") if self.path is not None else BytesIO(self.data)
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def image_size(source):
+    """(width, height) read from the image header only, without decoding pixels."""
+    from PIL import Image
+    with Image.open(source if isinstance(source, str) else BytesIO(source)) as img:
+        return img.size
+
+
+def reduce_flag(longest, min_side):
+    """
+    Picks the largest IMREAD_REDUCED_COLOR_{2,4,8} factor that keeps the
+    image's longest side at or above `min_side`. libjpeg decodes those
+    directly at reduced size, skipping most of the work.
+    """
+    import cv2
+    factor = 1
+    while factor < 8 and min_side and longest / (factor * 2) >= min_side:
+        factor *= 2
+    return {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }[factor]
+
+
+def decode_rgb(source, min_side=None, size=None):
+    """
+    Decodes an upload (bytes or a spooled file path) once into an RGB array,
+    at reduced resolution when `min_side` allows. `size` is the (width,
+    height) from image_size() if the caller already read it. The BGR->RGB
+    swap is done in place, so no extra full-size copy is made.
+    """
+    import cv2
+
+    if isinstance(source, str):
+        buffer = np.fromfile(source, dtype=np.uint8)
+    else:
+        buffer = np.frombuffer(source, dtype=np.uint8)
+
+    flag = cv2.IMREAD_COLOR
+    if min_side:
+        try:
+            width, height = size or image_size(source)
+            flag = reduce_flag(max(width, height), min_side)
+        except Exception:
+            pass  # unknown header; let OpenCV try a full decode
+
+    img = cv2.imdecode(buffer, flag)
+    if img is None:
+        raise InvalidImage("Invalid image format")
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)
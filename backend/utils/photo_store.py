@@ -0,0 +1,98 @@
+import hashlib
+import os
+from datetime import datetime
+import gridfs
+from pymongo import MongoClient
+
+client = MongoClient(os.getenv("MONGO_URI"))
+db = client[os.getenv("DB_NAME")]
+
+photo_fs = gridfs.GridFS(db, collection="attendance_photos")
+recognition_memo = db["recognition_memo"]
+
+# Memoized recognition results expire after this many days
+RECOGNITION_MEMO_TTL_DAYS = int(os.getenv("RECOGNITION_MEMO_TTL_DAYS", 30))
+
+# Bump when matching logic changes so stale memo entries are not reused
+RECOGNITION_VERSION = 3
+
+_indexes_ready = False
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        recognition_memo.create_index(
+            "created_at", expireAfterSeconds=RECOGNITION_MEMO_TTL_DAYS * 86400
+        )
+        _indexes_ready = True
+
+
+def photo_key(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def store_photo(data, content_type=None, key=None):
+    """
+    Stores a photo (bytes or a readable file) in GridFS under its SHA-256 and
+    returns the key. The same bytes uploaded again are not written a second
+    time. Pass `key` when the hash is already known.
+    """
+    key = key or photo_key(data)
+    if not photo_fs.exists(key):
+        try:
+            photo_fs.put(data, _id=key, filename=key, contentType=content_type)
+        except gridfs.errors.FileExists:
+            pass  # stored concurrently by another request
+    return key
+
+
+def load_photo(key):
+    return photo_fs.get(key).read()
+
+
+def cohort_fingerprint(known_encs, known_names, known_ids):
+    """Changes whenever the cohort a photo was matched against changes."""
+    digest = hashlib.sha256(known_encs.tobytes())
+    for name, student_id in zip(known_names, known_ids):
+        digest.update(f"{student_id}:{name}".encode())
+    return digest.hexdigest()
+
+
+def _memo_id(key, fingerprint):
+    return f"{key}:{fingerprint}:v{RECOGNITION_VERSION}"
+
+
+def get_recognition(key, fingerprint):
+    """
+    Returns a memoized (present, unknown, total, present_ids, faces) for these
+    bytes and cohort, or None.
+    """
+    memo = recognition_memo.find_one({"_id": _memo_id(key, fingerprint)})
+    if memo is None:
+        return None
+    return memo["present"], memo["unknown"], memo["total"], memo["present_ids"], memo["faces"]
+
+
+def save_recognition(key, fingerprint, present, unknown, total, present_ids, faces):
+    """
+    Memoizes a successful recognition. A result with no faces is not stored:
+    it may come from a failed decode or detection, and memoizing it would
+    make every re-upload of the same bytes fail the same way.
+    """
+    if not total:
+        return
+    _ensure_indexes()
+    recognition_memo.replace_one(
+        {"_id": _memo_id(key, fingerprint)},
+        {
+            "photo_key": key,
+            "present": present,
+            "unknown": unknown,
+            "total": total,
+            "present_ids": present_ids,
+            "faces": faces,
+            "created_at": datetime.utcnow(),
+        },
+        upsert=True
+    )
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pymongo import MongoClient, UpdateOne
+
+client = MongoClient(os.getenv("MONGO_URI"))
+db = client[os.getenv("DB_NAME")]
+
+grading_verdicts = db["grading_verdicts"]
+
+logger = logging.getLogger(__name__)
+
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", 20000))
+# Stored verdicts expire after this many days
+VERDICT_CACHE_TTL_DAYS = int(os.getenv("VERDICT_CACHE_TTL_DAYS", 180))
+
+_SPACES = re.compile(r"\s+")
+# Sentence punctuation closing an answer; "!" is left alone as it can be a factorial
+_TRAILING_PUNCTUATION = re.compile(r"[.,;:?]+$")
+# Part of every verdict key; bump when normalize_answer() folds differently
+NORMALIZATION_VERSION = 2
+
+_TOKENS = re.compile(r"[-+]?\d+(?:\.\d+)?|[a-z]+(?:'[a-z]+)?")
+_NEGATIONS = {"not", "no", "never", "none", "nor", "neither", "nothing", "nobody", "nowhere", "cannot", "without"}
+
+
+def normalize_answer(text):
+    """
+    Only case, spacing and punctuation closing the sentence are folded.
+    Signs, decimal points, operators and symbols such as + or # can change
+    whether an answer is right ("-5" vs "5", "C#" vs "C"), so they are kept.
+    """
+    text = unicodedata.normalize("NFC", text or "").lower()
+    text = _SPACES.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text).rstrip()
+
+
+def critical_tokens(text):
+    """
+    The parts of an answer that flip its meaning however similar the rest
+    is: whether it is negated ("<not>") and the numbers it states, as
+    normalised decimals. Two answers with different critical tokens must
+    not share a verdict on similarity alone.
+    """
+    tokens = set()
+    for token in _TOKENS.findall(normalize_answer(text)):
+        if token[-1].isdigit():
+            try:
+                tokens.add(str(Decimal(token).normalize()))
+            except InvalidOperation:
+                tokens.add(token)
+        elif token in _NEGATIONS or token.endswith("n't"):
+            tokens.add("<not>")
+    return frozenset(tokens)
+
+
+def verdict_key(question_id, reference, answer_text, grader_version):
+    payload = json.dumps([str(question_id), (reference or "").strip().lower(),
+                          normalize_answer(answer_text), grader_version, NORMALIZATION_VERSION])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class VerdictCache:
+    """
+    Grading verdicts by verdict_key(): an in-process LRU in front of the
+    `grading_verdicts` collection, so every worker shares what any of them
+    already paid the LLM for.
+    """
+
+    def __init__(self, max_entries=VERDICT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._indexes_ready = False
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    def _ensure_indexes(self):
+        if not self._indexes_ready:
+            grading_verdicts.create_index("created_at", expireAfterSeconds=VERDICT_CACHE_TTL_DAYS * 86400)
+            self._indexes_ready = True
+
+    def _remember(self, key, verdict, tokens):
+        self._entries[key] = (verdict, tokens)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        """Returns {key: verdict} for the keys already graded; one $in query for memory misses."""
+        found, missing = {}, []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    missing.append(key)
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[0]
+                self.memory_hits += 1
+                self.tokens_saved += entry[1]
+
+        stored = []
+        if missing:
+            try:
+                stored = list(grading_verdicts.find({"_id": {"$in": missing}}, {"verdict": 1, "tokens": 1}))
+            except Exception as e:
+                logger.error(f"Verdict store lookup failed: {e}", exc_info=True)
+
+        with self._lock:
+            for doc in stored:
+                found[doc["_id"]] = doc["verdict"]
+                self._remember(doc["_id"], doc["verdict"], doc.get("tokens", 0))
+                self.store_hits += 1
+                self.tokens_saved += doc.get("tokens", 0)
+            self.misses += len(missing) - len(stored)
+        return found
+
+    def put_many(self, verdicts, grader_version=None):
+        """Stores {key: (verdict, estimated tokens of grading it)}."""
+        if not verdicts:
+            return
+        with self._lock:
+            for key, (verdict, tokens) in verdicts.items():
+                self._remember(key, verdict, tokens)
+        try:
+            self._ensure_indexes()
+            grading_verdicts.bulk_write([
+                UpdateOne({"_id": key}, {"$set": {
+                    "verdict": verdict,
+                    "tokens": tokens,
+                    "grader_version": grader_version,
+                    "created_at": datetime.utcnow()
+                }}, upsert=True)
+                for key, (verdict, tokens) in verdicts.items()
+            ], ordered=False)
+        except Exception as e:
+            logger.error(f"Verdict store write failed: {e}", exc_info=True)
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.store_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "estimated_tokens_saved": self.tokens_saved,
+            }
+
+
+verdict_cache = VerdictCache()
@@ -0,0 +1,192 @@
+import os
+import numpy as np
+from utils.face_profiles import select_profile
+
+# Seconds between sampled frames: starts at the base interval, halves while
+# new faces keep appearing and doubles (up to the max) while the scene is static
+FACE_VIDEO_SAMPLE_SECONDS = float(os.getenv("FACE_VIDEO_SAMPLE_SECONDS", 0.5))
+FACE_VIDEO_MAX_SAMPLE_SECONDS = float(os.getenv("FACE_VIDEO_MAX_SAMPLE_SECONDS", 2.0))
+FACE_VIDEO_MAX_SECONDS = float(os.getenv("FACE_VIDEO_MAX_SECONDS", 60))
+# Encodings kept per tracked face; later ones only when the face is seen larger
+FACE_VIDEO_ENCODINGS_PER_TRACK = int(os.getenv("FACE_VIDEO_ENCODINGS_PER_TRACK", 3))
+
+TRACK_IOU = 0.3
+# Sampled frames a track survives without being seen
+TRACK_MAX_MISSES = 3
+# A re-encode needs the face this much larger than at its last encoding
+REENCODE_AREA_GAIN = 1.3
+
+
+class InvalidVideo(ValueError):
+    pass
+
+
+def probe_video(path):
+    """
+    Seconds of video according to the container header, read without
+    decoding any frame; None when the container does not record it.
+    Raises InvalidVideo if OpenCV cannot open the file.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(path) if path else None
+    if capture is None or not capture.isOpened():
+        raise InvalidVideo("Unreadable video")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        frames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+    finally:
+        capture.release()
+    return frames / fps if fps > 0 and frames > 0 else None
+
+
+def box_iou(a, b):
+    """IoU of two (top, right, bottom, left) boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    inter = (bottom - top) * (right - left)
+    return inter / float(box_area(a) + box_area(b) - inter)
+
+
+def box_area(box):
+    return max(box[2] - box[0], 0) * max(box[1] - box[3], 0)
+
+
+class FaceTrack:
+    def __init__(self, box):
+        self.box = box
+        self.misses = 0
+        self.encodings = []
+        self.encoded_area = 0
+
+    def wants_encoding(self):
+        if not self.encodings:
+            return True
+        return (len(self.encodings) < FACE_VIDEO_ENCODINGS_PER_TRACK
+                and box_area(self.box) >= self.encoded_area * REENCODE_AREA_GAIN)
+
+    def encoding(self):
+        return np.mean(self.encodings, axis=0)
+
+
+class IoUTracker:
+    """Links detections across sampled frames by bounding-box overlap."""
+
+    def __init__(self):
+        self.active = []
+        self.finished = []
+
+    def update(self, boxes):
+        """Matches boxes to live tracks; returns (tracks for each box, number of new tracks)."""
+        pairs = sorted(
+            ((box_iou(track.box, box), t, b)
+             for t, track in enumerate(self.active)
+             for b, box in enumerate(boxes)),
+            reverse=True
+        )
+        assigned = [None] * len(boxes)
+        used = set()
+        for iou, t, b in pairs:
+            if iou < TRACK_IOU:
+                break
+            if t in used or assigned[b] is not None:
+                continue
+            used.add(t)
+            assigned[b] = self.active[t]
+            assigned[b].box = boxes[b]
+            assigned[b].misses = 0
+
+        for t, track in enumerate(self.active):
+            if t not in used:
+                track.misses += 1
+
+        new = 0
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                assigned[b] = FaceTrack(box)
+                self.active.append(assigned[b])
+                new += 1
+
+        still_active = []
+        for track in self.active:
+            (self.finished if track.misses > TRACK_MAX_MISSES else still_active).append(track)
+        self.active = still_active
+        return assigned, new
+
+    def tracks(self):
+        return [t for t in self.finished + self.active if t.encodings]
+
+
+def track_and_encode_video(path, expected_faces=None):
+    """
+    Reads a clip frame by frame from disk, samples frames adaptively, tracks
+    faces across them and encodes each tracked face a few times at most.
+    Returns one averaged encoding per tracked face. Only the first
+    FACE_VIDEO_MAX_SECONDS are read.
+
+    Runs inside a face-compute worker.
+    """
+    import cv2
+    import face_recognition
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise InvalidVideo("Unreadable video")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        base_step = max(int(fps * FACE_VIDEO_SAMPLE_SECONDS), 1)
+        max_step = max(int(fps * FACE_VIDEO_MAX_SAMPLE_SECONDS), base_step)
+        last_frame = int(fps * FACE_VIDEO_MAX_SECONDS)
+
+        tracker = IoUTracker()
+        step = base_step
+        frame_no = 0
+        next_sample = 0
+        profile = None
+
+        while frame_no <= last_frame:
+            # grab() still decodes the frame for most codecs, but skipped frames
+            # avoid the retrieve copy, colour conversion and detection. Seeking
+            # with CAP_PROP_POS_FRAMES instead is inexact on inter-frame codecs.
+            if not capture.grab():
+                break
+            if frame_no < next_sample:
+                frame_no += 1
+                continue
+
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+            if profile is None:
+                profile = select_profile(rgb.shape, expected_faces)
+            scale = profile.detect_scale(rgb.shape)
+            small = rgb if scale == 1.0 else cv2.resize(rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+            boxes = [
+                tuple(int(v / scale) for v in loc)
+                for loc in face_recognition.face_locations(small, profile.upsample, profile.model)
+            ]
+            tracks, new = tracker.update(boxes)
+
+            to_encode = [(track, box) for track, box in zip(tracks, boxes) if track.wants_encoding()]
+            if to_encode:
+                encodings = face_recognition.face_encodings(
+                    rgb, [box for _, box in to_encode], profile.num_jitters, profile.landmark_model
+                )
+                for (track, box), encoding in zip(to_encode, encodings):
+                    track.encodings.append(encoding)
+                    track.encoded_area = box_area(box)
+
+            # Sample faster while people are still coming into view
+            step = max(step // 2, base_step // 2, 1) if new else min(step * 2, max_step)
+            next_sample = frame_no + step
+            frame_no += 1
+    finally:
+        capture.release()
+
+    return [track.encoding() for track in tracker.tracks()]